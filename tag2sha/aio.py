@@ -0,0 +1,119 @@
+"""
+Awaitable API for resolving action references.
+
+Example:
+
+    async with AsyncResolver(token, limit=20) as resolver:
+        sha, tag = await resolver.resolve('actions/checkout', 'v4')
+        results = await resolver.resolve_many([('actions/setup-python', 'v5', MODE_PIN),
+                                               ('docker/login-action', None, MODE_LATEST)])
+"""
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from tag2sha import engine
+from tag2sha.cache import ResolutionCache
+from tag2sha.refs import MODE_LATEST, MODE_PIN, MODE_RELEASE, Key, Resolution
+from tag2sha.resolver import parse_action_repo, resolution_key, resolve_reference
+
+DEFAULT_LIMIT = 10
+
+
+class AsyncResolver:
+    """
+    Resolve references from asyncio code without blocking the event loop.
+
+    Resolutions run the blocking resolver functions on at most limit worker
+    threads, which share the pooled HTTP session of tag2sha.github; configure
+    its pool_maxsize to at least limit to give every worker a connection.
+    Results are memoized in resolution_cache, and concurrent requests for the
+    same reference share a single resolution.
+    """
+
+    def __init__(self, token: str = None, limit: int = DEFAULT_LIMIT,
+                 resolution_cache: Optional[ResolutionCache] = None):
+        self.token = token
+        self.limit = limit
+        self.resolution_cache = resolution_cache if resolution_cache is not None else ResolutionCache()
+        self._executor = ThreadPoolExecutor(max_workers=limit, thread_name_prefix='tag2sha')
+        self._futures: Set[Future] = set()
+        self._futures_lock = threading.Lock()
+
+    async def __aenter__(self) -> 'AsyncResolver':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Cancel the resolutions that have not started, e.g. after one of a
+        gather() failed, and release the worker threads once the running ones end.
+        """
+        # ThreadPoolExecutor.shutdown(cancel_futures=True) needs Python 3.9
+        with self._futures_lock:
+            futures, self._futures = self._futures, set()
+        for future in futures:
+            future.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _forget(self, future: Future) -> None:
+        with self._futures_lock:
+            self._futures.discard(future)
+
+    async def _run(self, func, *args):
+        future = self._executor.submit(func, *args)
+        with self._futures_lock:
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+        return await asyncio.wrap_future(future)
+
+    async def resolve(self, repo: str, ref: Optional[str], mode: str = MODE_PIN) -> Resolution:
+        """
+        Resolve one reference.
+
+        Args:
+            repo: Repository or action path, e.g. 'actions/checkout' or 'github/super-linter/slim'
+            ref: Tag, branch or major version like 'v4'; ignored for MODE_LATEST
+            mode: MODE_PIN, MODE_RELEASE (also convert main/master to the latest release)
+                or MODE_LATEST (resolve the latest release)
+
+        Returns:
+            Tuple of (sha, resolved_ref); sha is None if the reference could not be resolved
+        """
+        base_repo, _ = parse_action_repo(repo)
+        key = resolution_key(base_repo, ref, mode == MODE_RELEASE, mode == MODE_LATEST)
+        return await self._run(self.resolution_cache.get_or_resolve, key,
+                               partial(resolve_reference, *key, self.token))
+
+    async def resolve_many(self, items: Iterable[Tuple[str, Optional[str], str]]) -> List[Resolution]:
+        """Resolve (repo, ref, mode) items concurrently, returning results in the same order."""
+        return list(await asyncio.gather(*(self.resolve(*item) for item in items)))
+
+    async def resolve_captured(self, keys: Iterable[Key]) -> Dict[Key, Tuple[Resolution, engine.Output]]:
+        """
+        Resolve resolution keys concurrently, bypassing the resolution cache, and
+        capture what each resolution prints. Must run inside engine.capturing_output().
+        """
+        keys = list(keys)
+        results = await asyncio.gather(*(
+            self._run(engine.run_captured, partial(resolve_reference, *key, self.token))
+            for key in keys
+        ))
+        return dict(zip(keys, results))
+
+
+async def resolve(repo: str, ref: Optional[str], mode: str = MODE_PIN, token: str = None) -> Resolution:
+    """Resolve one reference; see AsyncResolver.resolve."""
+    async with AsyncResolver(token, limit=1) as resolver:
+        return await resolver.resolve(repo, ref, mode)
+
+
+async def resolve_many(items: Iterable[Tuple[str, Optional[str], str]], token: str = None,
+                       limit: int = DEFAULT_LIMIT) -> List[Resolution]:
+    """Resolve (repo, ref, mode) items with at most limit in flight; see AsyncResolver.resolve_many."""
+    async with AsyncResolver(token, limit) as resolver:
+        return await resolver.resolve_many(items)
@@ -0,0 +1,382 @@
+"""Caches for reference resolutions."""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class ResolutionCache:
+    """
+    Run-scoped memo of reference resolutions, shared by every workflow file.
+
+    Concurrent lookups of a key that is already being resolved wait for that
+    resolution instead of starting their own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results: Dict[Hashable, Any] = {}
+        self._pending: Dict[Hashable, threading.Event] = {}
+        self._deferred: Dict[Hashable, Callable[[], None]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._results
+
+    def prime(self, key: Hashable, result: Any, on_first_use: Optional[Callable[[], None]] = None) -> None:
+        """
+        Store a result resolved elsewhere, e.g. by a batch or concurrent resolver.
+
+        If on_first_use is given, the first lookup of key calls it and counts
+        as the miss that resolved it, just as if it had been resolved there.
+        """
+        with self._lock:
+            self._results[key] = result
+            if on_first_use is not None:
+                self._deferred[key] = on_first_use
+
+    def get_or_resolve(self, key: Hashable, resolve: Callable[[], Any]) -> Any:
+        """Return the cached result for key, calling resolve() on first use."""
+        on_first_use = None
+        with self._lock:
+            if key in self._results:
+                on_first_use = self._deferred.pop(key, None)
+                if on_first_use is None:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                cached, result = True, self._results[key]
+            else:
+                cached = False
+                event = self._pending.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self._pending[key] = event
+                    self.misses += 1
+                    owner = True
+                else:
+                    self.hits += 1
+                    owner = False
+
+        if cached:
+            if on_first_use is not None:
+                on_first_use()
+            return result
+
+        if not owner:
+            event.wait()
+            with self._lock:
+                if key in self._results:
+                    return self._results[key]
+            # The resolving thread raised; try again on our own
+            return resolve()
+
+        try:
+            result = resolve()
+            with self._lock:
+                self._results[key] = result
+            return result
+        finally:
+            with self._lock:
+                del self._pending[key]
+            event.set()
+
+
+# Kinds of facts stored in the persistent cache, mapped to their default TTL
+# in seconds. None means the fact can never change and is kept until evicted.
+DEFAULT_TTLS: Dict[str, Optional[int]] = {
+    'commit': None,           # a full SHA names a commit
+    'peel': None,             # an annotated tag object peels to a commit
+    'tag': 24 * 60 * 60,      # tag name -> commit SHA
+    'branch': 5 * 60,         # branch head -> commit SHA
+    'latest_release': 60 * 60,
+    'matching_tag': 60 * 60,  # version pattern like 'v4' -> newest matching tag
+    'http': None,             # ETag/Last-Modified and body, revalidated on every use
+    'proxy': None,            # API response served by tag2sha proxy, revalidated once older than --max-age
+}
+
+DEFAULT_MAX_ENTRIES = 10000
+
+CACHE_FORMAT_VERSION = 1
+
+
+def default_cache_dir() -> str:
+    """Return the per-user cache directory, honouring XDG_CACHE_HOME."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'tag2sha')
+
+
+class FactCache:
+    """
+    Cache of resolution facts keyed by (kind, repo, ref).
+
+    This base class stores nothing; it is used when caching is disabled.
+    """
+
+    def get(self, kind: str, repo: str, ref: str) -> Optional[Any]:
+        return None
+
+    def set(self, kind: str, repo: str, ref: str, value: Any) -> None:
+        pass
+
+    def fetch(self, kind: str, repo: str, ref: str, fetch: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """Return the cached fact, or call fetch() and store a non-None result."""
+        value = self.get(kind, repo, ref)
+        if value is not None:
+            return value
+        value = fetch()
+        if value is not None:
+            self.set(kind, repo, ref, value)
+        return value
+
+    def close(self) -> None:
+        pass
+
+
+class DiskCache(FactCache):
+    """
+    Persistent fact cache stored as a JSON file.
+
+    Each kind of fact expires after its own TTL. When the cache holds more
+    than max_entries facts, the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str, ttls: Optional[Dict[str, Optional[int]]] = None,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable cache {self.path}: {e}", file=sys.stderr)
+            return
+        if data.get('version') == CACHE_FORMAT_VERSION:
+            self._entries = data.get('entries', {})
+
+    def _expired(self, kind: str, entry: Dict[str, Any], now: float) -> bool:
+        ttl = self.ttls.get(kind)
+        return ttl is not None and now - entry['stored'] > ttl
+
+    def get(self, kind: str, repo: str, ref: str) -> Optional[Any]:
+        key = f"{kind}:{repo}@{ref}"
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(kind, entry, now):
+                return None
+            # Reads alone do not rewrite the file; the time is saved with the next write
+            entry['used'] = now
+            return entry['value']
+
+    def set(self, kind: str, repo: str, ref: str, value: Any) -> None:
+        key = f"{kind}:{repo}@{ref}"
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {'kind': kind, 'value': value, 'stored': now, 'used': now}
+            self._dirty = True
+
+    def close(self) -> None:
+        """
+        Drop expired facts, evict down to max_entries and write the cache file,
+        if anything was stored, expired or evicted since it was read.
+        """
+        now = time.time()
+        with self._lock:
+            entries = {key: entry for key, entry in self._entries.items()
+                       if not self._expired(entry['kind'], entry, now)}
+            if len(entries) > self.max_entries:
+                by_use = sorted(entries, key=lambda key: entries[key]['used'], reverse=True)
+                entries = {key: entries[key] for key in by_use[:self.max_entries]}
+            if not self._dirty and len(entries) == len(self._entries):
+                return
+            self._entries = entries
+            self._dirty = False
+
+            directory = os.path.dirname(self.path)
+            try:
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.cache-', suffix='.tmp')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump({'version': CACHE_FORMAT_VERSION, 'entries': entries}, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Warning: Could not write cache {self.path}: {e}", file=sys.stderr)
+
+
+class SqliteCache(FactCache):
+    """
+    Persistent fact cache in a SQLite database that concurrent processes can share.
+
+    The database runs in WAL mode so readers never block the writer. Facts are
+    written with atomic upserts, and fetch() takes a per-key lock row so that
+    only one process fetches a missing fact while the others wait for it.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS facts (
+            kind TEXT NOT NULL,
+            repo TEXT NOT NULL,
+            ref TEXT NOT NULL,
+            value TEXT NOT NULL,
+            stored REAL NOT NULL,
+            used REAL NOT NULL,
+            PRIMARY KEY (kind, repo, ref)
+        );
+        CREATE INDEX IF NOT EXISTS facts_repo_ref ON facts (repo, ref);
+        CREATE INDEX IF NOT EXISTS facts_used ON facts (used);
+        CREATE TABLE IF NOT EXISTS locks (
+            kind TEXT NOT NULL,
+            repo TEXT NOT NULL,
+            ref TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            expires REAL NOT NULL,
+            PRIMARY KEY (kind, repo, ref)
+        );
+    """
+
+    def __init__(self, path: str, ttls: Optional[Dict[str, Optional[int]]] = None,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, lock_timeout: float = 30.0,
+                 poll_interval: float = 0.05):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_entries = max_entries
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection to the database."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.lock_timeout, isolation_level=None)
+            conn.execute(f'PRAGMA busy_timeout={int(self.lock_timeout * 1000)}')
+            self._local.conn = conn
+        return conn
+
+    def _expired(self, kind: str, stored: float, now: float) -> bool:
+        ttl = self.ttls.get(kind)
+        return ttl is not None and now - stored > ttl
+
+    def get(self, kind: str, repo: str, ref: str) -> Optional[Any]:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute('SELECT value, stored FROM facts WHERE kind = ? AND repo = ? AND ref = ?',
+                           (kind, repo, ref)).fetchone()
+        if row is None or self._expired(kind, row[1], now):
+            return None
+        conn.execute('UPDATE facts SET used = ? WHERE kind = ? AND repo = ? AND ref = ?',
+                     (now, kind, repo, ref))
+        return json.loads(row[0])
+
+    def set(self, kind: str, repo: str, ref: str, value: Any) -> None:
+        now = time.time()
+        self._connect().execute(
+            'INSERT OR REPLACE INTO facts (kind, repo, ref, value, stored, used) VALUES (?, ?, ?, ?, ?, ?)',
+            (kind, repo, ref, json.dumps(value), now, now))
+
+    def _acquire(self, kind: str, repo: str, ref: str) -> bool:
+        """Try to take the fetch lock for a key, clearing it first if its owner died."""
+        conn = self._connect()
+        now = time.time()
+        owner = f"{os.getpid()}:{threading.get_ident()}"
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM locks WHERE kind = ? AND repo = ? AND ref = ? AND expires < ?',
+                         (kind, repo, ref, now))
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO locks (kind, repo, ref, owner, expires) VALUES (?, ?, ?, ?, ?)',
+                (kind, repo, ref, owner, now + self.lock_timeout))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return cursor.rowcount == 1
+
+    def _release(self, kind: str, repo: str, ref: str) -> None:
+        self._connect().execute('DELETE FROM locks WHERE kind = ? AND repo = ? AND ref = ?',
+                                (kind, repo, ref))
+
+    def fetch(self, kind: str, repo: str, ref: str, fetch: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """
+        Return the cached fact, or fetch and store it.
+
+        If another process is already fetching the same key, wait for its
+        result instead of repeating the request.
+        """
+        value = self.get(kind, repo, ref)
+        if value is not None:
+            return value
+
+        deadline = time.time() + self.lock_timeout
+        while True:
+            if self._acquire(kind, repo, ref):
+                try:
+                    # The previous lock holder may have stored it in the meantime
+                    value = self.get(kind, repo, ref)
+                    if value is None:
+                        value = fetch()
+                        if value is not None:
+                            self.set(kind, repo, ref, value)
+                    return value
+                finally:
+                    self._release(kind, repo, ref)
+
+            time.sleep(self.poll_interval)
+            value = self.get(kind, repo, ref)
+            if value is not None:
+                return value
+            if time.time() > deadline:
+                return fetch()
+
+    def close(self) -> None:
+        """Delete expired facts and evict down to max_entries."""
+        conn = self._connect()
+        now = time.time()
+        for kind, ttl in self.ttls.items():
+            if ttl is not None:
+                conn.execute('DELETE FROM facts WHERE kind = ? AND stored < ?', (kind, now - ttl))
+        conn.execute('DELETE FROM facts WHERE rowid IN '
+                     '(SELECT rowid FROM facts ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                     (self.max_entries,))
+        conn.close()
+        self._local.conn = None
+
+
+_fact_cache: FactCache = FactCache()
+
+
+def configure_fact_cache(fact_cache: FactCache) -> FactCache:
+    """Install the fact cache used by the resolver functions."""
+    global _fact_cache
+    _fact_cache = fact_cache
+    return fact_cache
+
+
+def get_fact_cache() -> FactCache:
+    """Return the fact cache used by the resolver functions."""
+    return _fact_cache
@@ -1,21 +1,67 @@
 #!/usr/bin/env python3
+import asyncio
 import os
-import re
 import sys
-import requests
 import yaml
 import argparse
+import hashlib
 import subprocess
 from typing import Dict, List, Tuple, Optional
 from datetime import datetime
-import semver
-import fnmatch
+from urllib.parse import urlsplit
+
+from tag2sha import aio, engine, github, graphql, lsrefs, lsremote, pipeline, stats
+from tag2sha.cache import DEFAULT_MAX_ENTRIES, DEFAULT_TTLS, DiskCache, FactCache, ResolutionCache, SqliteCache, configure_fact_cache, default_cache_dir
+from tag2sha.daemon import Daemon, DaemonClient, default_socket_path
+from tag2sha.lockfile import DEFAULT_LOCK_MAX_AGE, DEFAULT_LOCKFILE, Lockfile, LockfileError, lock_name
+from tag2sha.mirror import DEFAULT_MIRROR_REPOS, DEFAULT_REFRESH_INTERVAL, MirrorStore, default_mirror_dir
+from tag2sha.proxy import DEFAULT_MAX_AGE, DEFAULT_PORT, Proxy
+from tag2sha.ratelimit import RateLimitExhausted, RateLimitScheduler
+from tag2sha.refs import Key
+from tag2sha.resolver import get_commit_sha, get_latest_matching_tag, get_latest_release, parse_action_repo, resolution_key, resolve_reference
+from tag2sha.tokens import TokenPool, read_token_file
+
+# Exit statuses besides 0 (success) and 1 (some references could not be resolved)
+EXIT_ABORTED = 3  # Stopped before changing any file: rate limit exhausted or deadline passed
+EXIT_SKIPPED = 4  # Offline run that left some references unresolved
+
+def parse_cache_ttl(value: str) -> Tuple[str, int]:
+    """Parse a KIND=SECONDS cache TTL override."""
+    kind, _, seconds = value.partition('=')
+    if kind not in DEFAULT_TTLS or not seconds.isdigit():
+        raise argparse.ArgumentTypeError(f"invalid cache TTL '{value}', expected KIND=SECONDS")
+    return kind, int(seconds)
+
+def add_cache_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the options of the persistent resolution cache."""
+    parser.add_argument('--cache-dir', default=default_cache_dir(),
+                      help='Directory for the persistent resolution cache')
+    parser.add_argument('--cache-backend', choices=['json', 'sqlite'], default='json',
+                      help='Storage for the persistent cache; use sqlite when several tag2sha '
+                           'processes share a cache directory')
+    parser.add_argument('--no-cache', action='store_true',
+                      help='Do not read or write the persistent resolution cache')
+    parser.add_argument('--cache-max-entries', type=int, default=DEFAULT_MAX_ENTRIES,
+                      help='Evict least recently used cache entries beyond this many')
+    parser.add_argument('--cache-ttl', action='append', default=[], type=parse_cache_ttl, metavar='KIND=SECONDS',
+                      help=f'Override the cache TTL for one kind of fact ({", ".join(sorted(DEFAULT_TTLS))}); '
+                           'may be repeated')
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Convert GitHub Actions tags to SHA references')
     parser.add_argument('files', nargs='+', help='Workflow files to process')
-    parser.add_argument('--token', help='GitHub token for API authentication', 
-                      default=os.environ.get('GITHUB_TOKEN'))
+    parser.add_argument('--token', action='append', dest='tokens', metavar='TOKEN',
+                      help='GitHub token for API authentication (default: $GITHUB_TOKEN); repeat it to '
+                           'spread API requests over several tokens, each within its own rate limit')
+    parser.add_argument('--token-file',
+                      help='Read more tokens for the token pool from this file, one per line')
+    parser.add_argument('--api-url', default=os.environ.get('GITHUB_API_URL', github.DEFAULT_API_URL),
+                      help='Base URL of the GitHub REST API, e.g. a GitHub Enterprise Server or a '
+                           '"tag2sha proxy" (default: $GITHUB_API_URL or the public API)')
+    parser.add_argument('--graphql-url', default=os.environ.get('GITHUB_GRAPHQL_URL'),
+                      help='URL of the GitHub GraphQL API used by --resolver=graphql (default: '
+                           '$GITHUB_GRAPHQL_URL, the /api/graphql of a GitHub Enterprise Server --api-url, '
+                           'or the public API)')
     parser.add_argument('--dry-run', action='store_true', help='Print changes without modifying files')
     parser.add_argument('--branch', help='Create and switch to this branch for changes', 
                       default=f'tag-to-sha-{datetime.now().strftime("%Y%m%d-%H%M%S")}')
@@ -28,296 +74,230 @@ def parse_args():
                       help='Convert main/master branch references to latest release')
     parser.add_argument('--update-to-latest', action='store_true', 
                       help='Update all actions (tags and SHAs) to their latest releases')
-    return parser.parse_args()
-
-def get_latest_release(repo: str, token: str = None) -> Optional[str]:
-    """Get the latest release tag for a repository."""
-    headers = {}
-    if token:
-        headers['Authorization'] = f'token {token}'
-    
-    # Try the releases API first (excludes pre-releases by default)
-    releases_url = f'https://api.github.com/repos/{repo}/releases/latest'
-    response = requests.get(releases_url, headers=headers)
-    
-    if response.status_code == 200:
-        return response.json().get('tag_name')
-    
-    # If no official "latest" release, fall back to getting all releases/tags
-    tags_url = f'https://api.github.com/repos/{repo}/tags'
-    response = requests.get(tags_url, headers=headers)
-    
-    if response.status_code != 200:
-        print(f"Error: Could not fetch tags for {repo}", file=sys.stderr)
-        print(f"API response: {response.status_code} - {response.text}", file=sys.stderr)
-        return None
-    
-    tags = response.json()
-    if not tags:
-        return None
-    
-    # Try to find and sort semantic versions
-    versioned_tags = []
-    for tag in tags:
-        tag_name = tag['name']
-        # Skip tags that don't look like versions (no v prefix, no digits)
-        if not (tag_name.startswith('v') or any(c.isdigit() for c in tag_name)):
-            continue
-            
-        # Clean tag for semver parsing
-        clean_tag = tag_name
-        if tag_name.startswith('v'):
-            clean_tag = tag_name[1:]
-            
+    parser.add_argument('--resolver', choices=['rest', 'graphql', 'ls-remote', 'ls-refs'], default='rest',
+                      help='Resolve references one at a time through the REST API, in batches '
+                           'of up to 100 repositories per GraphQL query, or from the git refs of each '
+                           'repository, listed by git ls-remote or a native protocol v2 ls-refs request '
+                           'for just the needed prefixes; the git resolvers use no API requests and '
+                           'take the highest version tag as the latest release')
+    parser.add_argument('--git-base-url', default=lsremote.DEFAULT_GIT_BASE_URL,
+                      help='Base URL of the git repositories listed by the ls-remote and ls-refs resolvers')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                      help='Resolve up to this many unique references concurrently')
+    parser.add_argument('--wait-on-rate-limit', action='store_true',
+                      help='Wait for the rate limit to reset instead of stopping when it is exhausted')
+    parser.add_argument('--rate-limit-reserve', type=int, default=0,
+                      help='Leave this many requests of the rate limit unused')
+    parser.add_argument('--connect-timeout', type=float, default=github.DEFAULT_CONNECT_TIMEOUT,
+                      help='Seconds to wait for a connection to the GitHub API')
+    parser.add_argument('--read-timeout', type=float, default=github.DEFAULT_READ_TIMEOUT,
+                      help='Seconds to wait for the GitHub API to send data')
+    parser.add_argument('--deadline', type=float,
+                      help='Stop making API requests this many seconds after start')
+    parser.add_argument('--max-retries', type=int, default=github.DEFAULT_MAX_RETRIES,
+                      help='Retries of a request after a connection error, timeout or 5xx response')
+    parser.add_argument('--pool-connections', type=int, default=github.DEFAULT_POOL_CONNECTIONS,
+                      help='Number of per-host HTTP connection pools to keep')
+    parser.add_argument('--pool-maxsize', type=int, default=github.DEFAULT_POOL_MAXSIZE,
+                      help='Maximum number of open connections per host')
+    parser.add_argument('--no-keep-alive', action='store_true',
+                      help='Open a new connection for every API request')
+    add_cache_arguments(parser)
+    parser.add_argument('--mirror', action='store_true',
+                      help='Resolve frequently used repositories from local bare mirrors, refreshed '
+                           'with an incremental git fetch')
+    parser.add_argument('--mirror-dir', default=default_mirror_dir(),
+                      help='Directory for the bare mirrors')
+    parser.add_argument('--mirror-repo', action='append', metavar='PATTERN',
+                      help=f'Mirror repositories matching this pattern; may be repeated '
+                           f'(default: {", ".join(DEFAULT_MIRROR_REPOS)})')
+    parser.add_argument('--mirror-refresh', type=int, default=DEFAULT_REFRESH_INTERVAL,
+                      help='Fetch a mirror again once its last fetch is older than this many seconds')
+    parser.add_argument('--daemon', default=default_socket_path(), metavar='ADDRESS',
+                      help='Resolve through a running "tag2sha serve" daemon at this Unix socket or '
+                           'http://127.0.0.1:PORT address, if one answers for the same --api-url; runs '
+                           'that set request, rate-limit or cache TTL options, or several tokens, resolve '
+                           'without it')
+    parser.add_argument('--daemon-token', default=os.environ.get('TAG2SHA_DAEMON_TOKEN'),
+                      help='Shared secret of a daemon listening on a port (default: $TAG2SHA_DAEMON_TOKEN)')
+    parser.add_argument('--no-daemon', action='store_true',
+                      help='Never resolve through a daemon')
+    parser.add_argument('--offline', action='store_true',
+                      help='Resolve only from local sources (the persistent cache, however old, the '
+                           'lockfile and existing mirrors) without any network access; exits with status 4 if references were skipped')
+    parser.add_argument('--lockfile',
+                      help=f'Record every resolution in this lockfile and reuse the ones it holds '
+                           f'(default with --frozen or --update-lock: {DEFAULT_LOCKFILE})')
+    lock_mode = parser.add_mutually_exclusive_group()
+    lock_mode.add_argument('--frozen', action='store_true',
+                      help='Rewrite workflows only from the lockfile, without any network access')
+    lock_mode.add_argument('--update-lock', action='store_true',
+                      help='Resolve again the lockfile entries older than --lock-max-age')
+    parser.add_argument('--lock-max-age', type=int, default=DEFAULT_LOCK_MAX_AGE,
+                      help='Age in seconds after which --update-lock resolves a locked reference again')
+    args = parser.parse_args()
+    
+    tokens = args.tokens or []
+    if args.token_file:
         try:
-            semver.parse(clean_tag)
-            versioned_tags.append((tag_name, clean_tag))
-        except ValueError:
-            # Skip tags that aren't valid semver
-            continue
-    
-    if versioned_tags:
-        # Sort by semantic version
-        sorted_tags = sorted(
-            versioned_tags,
-            key=lambda x: semver.VersionInfo.parse(x[1]),
-            reverse=True
-        )
-        return sorted_tags[0][0]  # Return the highest version tag
-        
-    # If no semantic versions found, just return the first tag
-    return tags[0]['name'] if tags else None
+            tokens.extend(read_token_file(args.token_file))
+        except OSError as e:
+            parser.error(f"Could not read --token-file: {e}")
+    if not tokens and os.environ.get('GITHUB_TOKEN'):
+        tokens = [os.environ['GITHUB_TOKEN']]
+    args.tokens = tokens
+    # Git resolvers, GraphQL batches and the daemon use the first token
+    args.token = tokens[0] if tokens else None
+    return args
 
-def get_latest_matching_tag(repo: str, version_pattern: str, token: str = None) -> Optional[str]:
-    """Get the latest tag that matches the given pattern."""
-    headers = {}
-    if token:
-        headers['Authorization'] = f'token {token}'
-    
-    # Fetch all tags for the repository
-    tags_url = f'https://api.github.com/repos/{repo}/tags'
-    response = requests.get(tags_url, headers=headers)
-    
-    if response.status_code != 200:
-        print(f"Error: Could not fetch tags for {repo}", file=sys.stderr)
-        print(f"API response: {response.status_code} - {response.text}", file=sys.stderr)
-        return None
-    
-    tags = response.json()
-    if not tags:
-        return None
-    
-    # Create a pattern for matching
-    # For example, if version_pattern is 'v4', we want to match 'v4*'
-    if version_pattern.startswith('v') and version_pattern[1:].isdigit():
-        # It's a simple version like 'v4', match with wildcard
-        pattern = f"{version_pattern}*"
+def cache_file_name(extension: str) -> str:
+    """
+    Return the name of the fact cache file for the configured API URL. Facts
+    about owner/repo on github.com say nothing about a repository of the same
+    name on a GitHub Enterprise Server, so every other API gets its own file.
+    """
+    api_url = github.get_api_url()
+    if api_url == github.DEFAULT_API_URL:
+        return f'cache.{extension}'
+    host = urlsplit(api_url).netloc.replace(':', '_')
+    digest = hashlib.sha1(api_url.encode()).hexdigest()[:8]
+    return f'cache-{host}-{digest}.{extension}'
+
+def open_fact_cache(args: argparse.Namespace, ttls: Dict[str, Optional[int]]) -> FactCache:
+    """Open the persistent fact cache selected by the cache options and make it the current one."""
+    if args.no_cache:
+        return configure_fact_cache(FactCache())
+    elif args.cache_backend == 'sqlite':
+        return configure_fact_cache(SqliteCache(
+            os.path.join(args.cache_dir, cache_file_name('db')),
+            ttls,
+            args.cache_max_entries
+        ))
     else:
-        # Exact match for other patterns
-        pattern = version_pattern
-    
-    # Find all matching tags
-    matching_tags = []
-    for tag in tags:
-        tag_name = tag['name']
-        if fnmatch.fnmatch(tag_name, pattern):
-            matching_tags.append(tag_name)
-    
-    if not matching_tags:
-        return None
-    
-    # Sort tags by semantic versioning if possible
-    try:
-        # Clean tags to valid semver if needed
-        clean_tags = []
-        for tag in matching_tags:
-            # Handle tags like 'v1.2.3'
-            tag_version = tag
-            if tag.startswith('v'):
-                tag_version = tag[1:]
-            
-            # Try to parse as semver, add if valid
-            try:
-                semver.parse(tag_version)
-                clean_tags.append((tag, tag_version))
-            except ValueError:
-                # If not valid semver, still keep the original tag
-                clean_tags.append((tag, None))
-        
-        # Sort by semantic version, putting non-semver tags at the end
-        sorted_tags = sorted(
-            clean_tags,
-            key=lambda x: semver.VersionInfo.parse(x[1]) if x[1] is not None else semver.VersionInfo(0, 0, 0),
-            reverse=True
-        )
-        return sorted_tags[0][0]  # Return the original tag name
-    except (ValueError, ImportError):
-        # Fallback to simple string sorting if semver parsing fails
-        matching_tags.sort(reverse=True)
-        return matching_tags[0]
+        return configure_fact_cache(DiskCache(
+            os.path.join(args.cache_dir, cache_file_name('json')),
+            ttls,
+            args.cache_max_entries
+        ))
 
-def parse_action_repo(action: str) -> Tuple[str, str]:
+def count_as_miss() -> None:
+    """on_first_use for prefetched keys: their first lookup counts as the miss that resolved them."""
+
+def prefetch_with_graphql(keys: List[Key], token: str, resolution_cache: ResolutionCache) -> None:
     """
-    Parse an action reference to separate repository and variant components.
-    
-    Args:
-        action: Full action reference like 'github/super-linter/slim' or 'actions/checkout'
+    Resolve keys in bulk through the GraphQL API and store them in the resolution cache.
+    Keys GraphQL cannot resolve are left for the REST resolver functions.
+    """
+    if not token:
+        print("Warning: The GraphQL resolver requires a token, using the REST API instead")
+        return
     
-    Returns:
-        Tuple of (base_repo, full_action) where:
-        - base_repo: Repository for API calls (e.g., 'github/super-linter')
-        - full_action: Full action path for workflow references (e.g., 'github/super-linter/slim')
+    resolved = graphql.resolve_batch(keys, token)
+    for key, result in resolved.items():
+        resolution_cache.prime(key, result, count_as_miss)
+    print(f"Resolved {len(resolved)} of {len(keys)} references with GraphQL; "
+          f"{len(keys) - len(resolved)} left for the REST API.")
+
+def prefetch_with_git(keys: List[Key], token: str, resolution_cache: ResolutionCache, resolver: str, base_url: str, jobs: int) -> None:
+    """
+    Resolve keys from the git refs of each repository and store them in the resolution cache.
+    Keys the git resolver cannot resolve are left for the REST resolver functions.
     """
-    parts = action.split('/')
-    if len(parts) > 2:
-        # Has variant like /slim - use only owner/repo for API calls
-        base_repo = f"{parts[0]}/{parts[1]}"
-        return base_repo, action
+    if resolver == 'ls-refs':
+        resolved = lsrefs.resolve_batch(keys, token, base_url, jobs)
     else:
-        # Standard owner/repo format
-        return action, action
+        resolved = lsremote.resolve_batch(keys, token, base_url, jobs)
+    for key, result in resolved.items():
+        resolution_cache.prime(key, result, count_as_miss)
+    print(f"Resolved {len(resolved)} of {len(keys)} references with {resolver}; "
+          f"{len(keys) - len(resolved)} left for the REST API.")
 
-def get_commit_sha(repo: str, tag: str, token: str = None, convert_main_to_release: bool = False) -> Tuple[str, str]:
+def prefetch_from_daemon(keys: List[Key], client: DaemonClient, token: str, resolution_cache: ResolutionCache) -> List[Key]:
     """
-    Get the commit SHA for a given tag/ref in a repository.
-    Returns a tuple of (sha, resolved_ref) where resolved_ref is the tag/ref that was actually used.
+    Resolve keys through a running daemon and store them in the resolution cache.
+    What the daemon printed for a key is printed when the key is first used.
+    Returns the keys left for the other resolvers: all of them if no daemon answered.
     """
-    resolved_ref = tag
-    original_ref = tag  # Store the original reference
-    
-    # Handle main/master branch conversion if enabled
-    if convert_main_to_release and tag.lower() in ['main', 'master']:
-        latest_release = get_latest_release(repo, token)
-        if latest_release:
-            print(f"Converting {repo}@{tag} to latest release: {latest_release}")
-            resolved_ref = latest_release
-            tag = latest_release
-        else:
-            print(f"Warning: No releases found for {repo}, keeping {tag} reference")
-    
-    # Check if this is a version reference (like 'v4') that should get the latest matching tag
-    elif tag.startswith('v') and len(tag) > 1 and tag[1:].isdigit():
-        # It's a version reference like 'v4', find the latest matching tag
-        latest_tag = get_latest_matching_tag(repo, tag, token)
-        if latest_tag and latest_tag != tag:
-            print(f"Resolving {repo}@{tag} to latest matching tag: {latest_tag}")
-            resolved_ref = latest_tag
-            tag = latest_tag
-    
-    headers = {}
-    if token:
-        headers['Authorization'] = f'token {token}'
-    
-    # Try to get the reference
-    ref_url = f'https://api.github.com/repos/{repo}/git/refs/tags/{tag}'
-    response = requests.get(ref_url, headers=headers)
-    
-    # If it's not a tag, try as a branch/ref
-    if response.status_code != 200:
-        ref_url = f'https://api.github.com/repos/{repo}/git/refs/heads/{tag}'
-        response = requests.get(ref_url, headers=headers)
+    status = client.status() if keys else None
+    # A daemon for another API (say, GitHub Enterprise Server) resolves other references
+    if status is None or status.get('api_url') != github.get_api_url():
+        return keys
+    results = client.resolve(keys, token)
+    if results is None:
+        return keys
+    for key, (result, output) in results.items():
+        resolution_cache.prime(key, result, lambda output=output: engine.replay(
+            [(sys.stderr if stream == 'stderr' else sys.stdout, text) for stream, text in output]))
+    print(f"Resolved {len(results)} references through the tag2sha daemon at {client.address}.")
+    return []
+
+def daemon_can_serve(args: argparse.Namespace) -> bool:
+    """
+    Return True if a daemon would resolve the way this run asks to. The daemon
+    applies its own request policy, rate-limit options, cache TTLs and token,
+    so runs that set any of them resolve on their own.
+    """
+    return (args.deadline is None
+            and args.max_retries == github.DEFAULT_MAX_RETRIES
+            and args.connect_timeout == github.DEFAULT_CONNECT_TIMEOUT
+            and args.read_timeout == github.DEFAULT_READ_TIMEOUT
+            and not args.wait_on_rate_limit
+            and args.rate_limit_reserve == 0
+            and not args.cache_ttl
+            and len(args.tokens) <= 1)
+
+def prefetch_from_mirrors(keys: List[Key], mirrors: MirrorStore, resolution_cache: ResolutionCache, jobs: int) -> List[Key]:
+    """
+    Resolve the keys of mirrored repositories from their local refs and store them in the resolution cache.
+    Returns the keys left for the other resolvers.
+    """
+    resolved = mirrors.resolve_batch(keys, jobs)
+    for key, result in resolved.items():
+        resolution_cache.prime(key, result, count_as_miss)
+    if resolved:
+        print(f"Resolved {len(resolved)} of {len(keys)} references from local mirrors.")
+    return [key for key in keys if key not in resolved]
+
+def prefetch_concurrently(keys: List[Key], token: str, resolution_cache: ResolutionCache, jobs: int) -> None:
+    """
+    Resolve keys that are not yet cached through the async resolver, at most jobs at a time.
+    Output of each resolution is replayed when the key is first used, so the
+    run prints the same lines in the same order as a serial run.
+    """
+    pending = [key for key in keys if key not in resolution_cache]
+    if not pending:
+        return
     
-    if response.status_code == 200:
-        ref_data = response.json()
-        ref_type = ref_data.get('object', {}).get('type')
-        
-        if ref_type == 'tag':
-            # This is an annotated tag, need to get the commit it points to
-            tag_sha = ref_data['object']['sha']
-            tag_obj_url = f'https://api.github.com/repos/{repo}/git/tags/{tag_sha}'
-            tag_obj_response = requests.get(tag_obj_url, headers=headers)
-            if tag_obj_response.status_code == 200:
-                return tag_obj_response.json()['object']['sha'], resolved_ref
-        else:
-            # This is a direct reference to a commit
-            return ref_data['object']['sha'], resolved_ref
+    async def resolve_pending():
+        async with aio.AsyncResolver(token, jobs) as resolver:
+            return await resolver.resolve_captured(pending)
     
-    # If we can't find the ref or something else went wrong
-    print(f"Error: Could not find SHA for {repo}@{tag}", file=sys.stderr)
-    print(f"API response: {response.status_code} - {response.text}", file=sys.stderr)
-    return None, resolved_ref
+    with engine.capturing_output():
+        results = asyncio.run(resolve_pending())
+    for key, (result, output) in results.items():
+        resolution_cache.prime(key, result, lambda output=output: engine.replay(output))
 
-def process_workflow_file(file_path: str, token: str, dry_run: bool = False, convert_main_to_release: bool = False, update_to_latest: bool = False) -> Tuple[int, int]:
+def process_workflow_file(file_path: str, token: str, dry_run: bool = False, convert_main_to_release: bool = False, update_to_latest: bool = False, resolution_cache: Optional[ResolutionCache] = None) -> Tuple[int, int]:
     """
     Process a workflow file, replacing tags with SHAs.
+    Resolutions are looked up in resolution_cache, which can be shared across files.
     Returns a tuple of (changes_made, errors).
     """
-    with open(file_path, 'r') as f:
-        content = f.read()
-    
-    # Regular expression to match GitHub action references
-    # Matches patterns like: uses: owner/repo@tag or uses: owner/repo/variant@sha  # tag
-    action_pattern = re.compile(r'(\s+uses:\s+)([^@\s]+)@([^#\s]+)(\s*(?:#\s*(.*))?)?$', re.MULTILINE)
+    if resolution_cache is None:
+        resolution_cache = ResolutionCache()
     
-    changes_made = 0
-    errors = 0
-    new_content = content
-    
-    for match in action_pattern.finditer(content):
-        prefix, full_action, version, comment_part, comment_text = match.groups()
-        
-        # Parse the action to separate base repository from variant
-        base_repo, full_action = parse_action_repo(full_action)
-        
-        # Determine the current version and whether it's a SHA
-        is_sha = re.match(r'^[0-9a-f]{40}$', version)
-        current_version = version
-        
-        if update_to_latest:
-            # When updating to latest, always get the latest release (using base repo for API)
-            latest_release = get_latest_release(base_repo, token)
-            if not latest_release:
-                print(f"Warning: No release found for {base_repo}, skipping")
-                errors += 1
-                continue
-            
-            # Get SHA for latest release (using base repo for API)
-            sha, resolved_ref = get_commit_sha(base_repo, latest_release, token, False)
-            if not sha:
-                errors += 1
-                continue
-            
-            # Check if we actually need to update
-            if is_sha and comment_text and comment_text.strip() == latest_release:
-                # Already at latest release
-                continue
-            elif not is_sha and version == latest_release:
-                # Already at latest release
-                continue
-            
-            print(f"Action: {full_action}@{version} → {full_action}@{sha}  # {latest_release}")
-            new_line = f"{prefix}{full_action}@{sha}  # {latest_release}"
-            
-        else:
-            # Original behavior: skip SHA references unless converting main to release
-            if is_sha:
-                continue
-            
-            # Get the SHA for this tag (using base repo for API)
-            sha, resolved_ref = get_commit_sha(base_repo, version, token, convert_main_to_release)
-            if not sha:
-                errors += 1
-                continue
-            
-            # Debug output
-            print(f"Action: {full_action}@{version} → SHA with tag: {resolved_ref}")
-            
-            # Create the replacement with simplified comment format - always use resolved_ref
-            if comment_part and comment_part.strip():
-                new_line = f"{prefix}{full_action}@{sha}{comment_part}"
-            else:
-                new_line = f"{prefix}{full_action}@{sha}  # {resolved_ref}"
-        
-        # Replace this specific occurrence
-        new_content = new_content.replace(match.group(0), new_line)
-        changes_made += 1
+    file_plan = pipeline.plan([file_path], convert_main_to_release, update_to_latest).files[0]
+    new_content, changes_made, errors = pipeline.rewrite(file_plan, resolver_for(resolution_cache, token))
     
     if changes_made > 0 and not dry_run:
-        with open(file_path, 'w') as f:
-            f.write(new_content)
+        pipeline.write(file_path, new_content)
     
     return changes_made, errors
 
+def resolver_for(resolution_cache: ResolutionCache, token: str):
+    """Return a function resolving keys through resolution_cache, falling back to the REST resolver."""
+    return lambda key: resolution_cache.get_or_resolve(key, lambda: resolve_reference(*key, token))
+
 def run_git_command(cmd, description=None, exit_on_error=True):
     """Run a git command and return its output."""
     try:
@@ -358,11 +338,103 @@ def push_branch(branch_name, remote):
     print(f"Pushing branch {branch_name} to {remote}...")
     run_git_command(['push', '-u', remote, branch_name], 'pushing branch')
 
+def serve_main(argv: List[str]) -> int:
+    """Run the resolution daemon: tag2sha serve [options]."""
+    parser = argparse.ArgumentParser(prog='tag2sha serve',
+                                     description='Answer resolve and rewrite requests from a warm cache')
+    parser.add_argument('--socket', default=default_socket_path(),
+                      help='Unix socket to listen on')
+    parser.add_argument('--port', type=int,
+                      help='Listen on this port of 127.0.0.1 instead of a Unix socket; every local user can '
+                           'connect to it, so it needs --client-token')
+    parser.add_argument('--token', help='GitHub token for requests that do not carry their own',
+                      default=os.environ.get('GITHUB_TOKEN'))
+    parser.add_argument('--api-url', default=os.environ.get('GITHUB_API_URL', github.DEFAULT_API_URL),
+                      help='Base URL of the GitHub REST API (default: $GITHUB_API_URL or the public API)')
+    parser.add_argument('--client-token', default=os.environ.get('TAG2SHA_DAEMON_TOKEN'),
+                      help='Only answer clients that send this shared secret (tag2sha --daemon-token SECRET; '
+                           'default: $TAG2SHA_DAEMON_TOKEN)')
+    parser.add_argument('--jobs', '-j', type=int, default=aio.DEFAULT_LIMIT,
+                      help='Resolve up to this many unique references of a request concurrently')
+    add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    github.configure_api_url(args.api_url)
+    github.configure_session(pool_maxsize=max(github.DEFAULT_POOL_MAXSIZE, args.jobs))
+    open_fact_cache(args, dict(args.cache_ttl))
+    try:
+        Daemon(args.token, args.jobs, dict(args.cache_ttl), args.client_token).serve(
+            None if args.port is not None else args.socket, args.port)
+    except (OSError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+def proxy_main(argv: List[str]) -> int:
+    """Run the caching API proxy: tag2sha proxy [options]."""
+    parser = argparse.ArgumentParser(prog='tag2sha proxy',
+                                     description='Serve the GitHub API requests of tag2sha clients from a shared cache')
+    parser.add_argument('--host', default='127.0.0.1',
+                      help='Address to listen on; use 0.0.0.0 to serve other machines. Every request is '
+                           'answered with the upstream --token, so anyone who can connect can read what it '
+                           'can read (private repositories included) unless --client-token is set')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                      help='Port to listen on')
+    parser.add_argument('--upstream', default=os.environ.get('GITHUB_API_URL', github.DEFAULT_API_URL),
+                      help='Base URL of the GitHub REST API to fetch from (default: $GITHUB_API_URL or the public API)')
+    parser.add_argument('--token', help='GitHub token for upstream requests',
+                      default=os.environ.get('GITHUB_TOKEN'))
+    parser.add_argument('--client-token', default=os.environ.get('TAG2SHA_PROXY_TOKEN'),
+                      help='Only answer clients that send this shared secret as their token '
+                           '(tag2sha --token SECRET --api-url ...; default: $TAG2SHA_PROXY_TOKEN)')
+    parser.add_argument('--max-age', type=int, default=DEFAULT_MAX_AGE,
+                      help='Serve a cached response for this many seconds before revalidating it upstream')
+    parser.add_argument('--rate-limit-reserve', type=int, default=0,
+                      help='Serve stale responses instead of spending the last this many requests of the rate limit')
+    parser.add_argument('--pool-maxsize', type=int, default=github.DEFAULT_POOL_MAXSIZE,
+                      help='Maximum number of open connections to the upstream API')
+    add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+
+    github.configure_api_url(args.upstream)
+    github.configure_session(pool_maxsize=args.pool_maxsize)
+    scheduler = github.configure_rate_limit(RateLimitScheduler(reserve=args.rate_limit_reserve))
+    open_fact_cache(args, dict(args.cache_ttl))
+    try:
+        Proxy(args.token, args.upstream, scheduler, args.max_age, args.client_token).serve(args.host, args.port)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
 def main():
+    if sys.argv[1:2] == ['serve']:
+        return serve_main(sys.argv[2:])
+    if sys.argv[1:2] == ['proxy']:
+        return proxy_main(sys.argv[2:])
     args = parse_args()
+    if args.jobs < 1:
+        print("Error: --jobs must be at least 1", file=sys.stderr)
+        return 1
+    github.configure_api_url(args.api_url, args.graphql_url)
+    # Give every worker its own connection to api.github.com
+    github.configure_session(args.pool_connections, max(args.pool_maxsize, args.jobs), not args.no_keep_alive)
+    if args.offline and args.push:
+        print("Error: --push needs the network and cannot be used with --offline", file=sys.stderr)
+        return 1
+    github.configure_requests(args.connect_timeout, args.read_timeout, args.deadline, args.max_retries,
+                              offline=args.offline)
+    github.configure_rate_limit(RateLimitScheduler(args.wait_on_rate_limit, args.rate_limit_reserve))
+    if len(args.tokens) > 1:
+        github.configure_token_pool(TokenPool(args.tokens, args.wait_on_rate_limit, args.rate_limit_reserve))
+    # Offline, a stale fact is better than none
+    cache_ttls = {kind: None for kind in DEFAULT_TTLS} if args.offline else dict(args.cache_ttl)
+    fact_cache = open_fact_cache(args, cache_ttls)
     
     if args.dry_run:
         print("Running in dry-run mode. No files will be changed.")
+    if args.offline:
+        print("Running offline. Only the local cache, lockfile and mirrors are used.")
     if args.convert_main_to_release:
         print("Will convert main/master references to latest release tags.")
     if args.update_to_latest:
@@ -375,36 +447,125 @@ def main():
     total_changes = 0
     total_errors = 0
     changed_files = []
+    resolution_cache = ResolutionCache()
     
+    # Plan: scan every file for the references it contains
+    file_paths = []
     for file_path in args.files:
         if not os.path.exists(file_path):
             print(f"Error: File not found: {file_path}")
             continue
-            
-        print(f"Processing {file_path}...")
-        changes, errors = process_workflow_file(
-            file_path, 
-            args.token, 
-            args.dry_run,
-            args.convert_main_to_release,
-            args.update_to_latest
-        )
+        file_paths.append(file_path)
+    run_plan = pipeline.plan(file_paths, args.convert_main_to_release, args.update_to_latest)
+    
+    # Resolve: every unique reference of the run, in bulk, starting from the lockfile
+    lock = None
+    locked = set()
+    lock_path = args.lockfile or (DEFAULT_LOCKFILE if args.frozen or args.update_lock else None)
+    if lock_path is None and args.offline and os.path.exists(DEFAULT_LOCKFILE):
+        lock_path = DEFAULT_LOCKFILE
+    if lock_path:
+        try:
+            lock = Lockfile(lock_path)
+        except LockfileError as e:
+            fact_cache.close()
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        max_age = args.lock_max_age if args.update_lock else None
+        for key in run_plan.keys:
+            result = lock.get(key, max_age)
+            if result:
+                resolution_cache.prime(key, result, count_as_miss)
+                locked.add(key)
+            elif args.frozen:
+                message = f"Error: {lock_name(key)} is not in the lockfile {lock_path}"
+                resolution_cache.prime(key, (None, key[1]), lambda message=message: print(message, file=sys.stderr))
+    
+    keys = [key for key in run_plan.keys if key not in resolution_cache]
+    resolver = args.resolver
+    if args.offline and resolver != 'rest' and not (resolver == 'ls-remote' and args.git_base_url.startswith('file://')):
+        print(f"Warning: The {resolver} resolver needs the network, using the local cache instead")
+        resolver = 'rest'
+    try:
+        if args.mirror:
+            mirrors = MirrorStore(args.mirror_dir, args.mirror_repo, args.git_base_url, args.mirror_refresh,
+                                  args.token, args.offline)
+            keys = prefetch_from_mirrors(keys, mirrors, resolution_cache, args.jobs)
+        if resolver == 'rest' and not (args.no_daemon or args.offline or args.no_cache) and daemon_can_serve(args):
+            keys = prefetch_from_daemon(keys, DaemonClient(args.daemon, args.daemon_token), args.token, resolution_cache)
+        if resolver == 'graphql':
+            prefetch_with_graphql(keys, args.token, resolution_cache)
+        elif resolver in ('ls-remote', 'ls-refs'):
+            prefetch_with_git(keys, args.token, resolution_cache, resolver, args.git_base_url, args.jobs)
+        prefetch_concurrently(keys, args.token, resolution_cache, args.jobs)
+    except (RateLimitExhausted, github.DeadlineExceeded) as e:
+        fact_cache.close()
+        print(f"\nError: {e}.", file=sys.stderr)
+        if isinstance(e, RateLimitExhausted):
+            print("No files were changed. Re-run after the reset, or pass --wait-on-rate-limit to wait for it.",
+                  file=sys.stderr)
+        else:
+            print("No files were changed. Re-run with a longer --deadline.", file=sys.stderr)
+        print(f"Network: {github.network_summary()}")
+        for line in github.token_summary():
+            print(f"  {line}")
+        return EXIT_ABORTED
+    
+    # Rewrite every file from the resolved references
+    rewrites = []
+    unresolved = []
+    resolve_cached = resolver_for(resolution_cache, args.token)
+    
+    def resolve(key):
+        result = resolve_cached(key)
+        if lock is not None and not (args.frozen or args.offline) and key not in locked:
+            lock.record(key, result)
+        return result
+    
+    for file_plan in run_plan.files:
+        print(f"Processing {file_plan.path}...")
+        file_unresolved = []
+        new_content, changes, errors = pipeline.rewrite(file_plan, resolve, file_unresolved)
+        unresolved.extend((file_plan.path, site) for site in file_unresolved)
         
         if changes > 0:
-            changed_files.append(file_path)
+            changed_files.append(file_plan.path)
+            rewrites.append((file_plan.path, new_content))
             
         if args.dry_run and changes > 0:
-            print(f"Would make {changes} changes to {file_path}")
+            print(f"Would make {changes} changes to {file_plan.path}")
         else:
-            print(f"Made {changes} changes to {file_path}")
+            print(f"Made {changes} changes to {file_plan.path}")
         
         if errors > 0:
-            print(f"Encountered {errors} errors while processing {file_path}")
+            print(f"Encountered {errors} errors while processing {file_plan.path}")
         
         total_changes += changes
         total_errors += errors
     
-    print(f"\nSummary: Made {total_changes} changes with {total_errors} errors across {len(args.files)} files.")
+    # Apply: write the rewritten files; a dry run stops after planning and resolving
+    if not args.dry_run:
+        for file_path, new_content in rewrites:
+            pipeline.write(file_path, new_content)
+        if lock is not None and not (args.frozen or args.offline) and lock.save():
+            changed_files.append(lock_path)
+    
+    fact_cache.close()
+    
+    print(f"\nSummary: Made {total_changes} changes with {total_errors} errors across {len(args.files)} files "
+          f"(resolution cache: {resolution_cache.hits} hits, {resolution_cache.misses} misses).")
+    if stats.get('prefilter_rejected'):
+        print(f"Prefilter: {stats.get('prefilter_rejected')} of {len(run_plan.files)} files contain no "
+              f"'uses:' and were skipped without being decoded")
+    print(f"Network: {github.network_summary()}")
+    for line in github.token_summary():
+        print(f"  {line}")
+    if lock is not None:
+        print(f"Lockfile: {len(locked)} of {len(run_plan.keys)} references taken from {lock_path}")
+    if args.offline and unresolved:
+        print(f"\nUnresolved references ({len(unresolved)}, not available offline):")
+        for file_path, site in unresolved:
+            print(f"  {file_path}: {site.full_action}@{site.version} (mode: {site.key[2]})")
     
     # Commit and push changes if we made any and we're not in dry-run mode
     if total_changes > 0 and not args.dry_run and not args.no_git:
@@ -418,7 +579,7 @@ def main():
                 print(f"Changes committed to branch {args.branch}. Use --push to push to remote.")
     
     if total_errors > 0:
-        return 1
+        return EXIT_SKIPPED if args.offline else 1
     return 0
 
 if __name__ == "__main__":
@@ -0,0 +1,306 @@
+"""
+Long-running resolution daemon with a warm cache, and the client the CLI uses to reach it.
+
+The daemon speaks JSON over HTTP, on a Unix socket or a localhost port:
+
+    GET  /status   -> {"pid": ..., "uptime": ..., "requests": ..., "resolved": ..., "api_url": ...}
+    POST /resolve  {"keys": [[repo, ref, mode], ...]}
+                   -> {"results": [[sha, tag, output], ...]}
+    POST /rewrite  {"path": ..., "content": ..., "convert_main_to_release": false, "update_to_latest": false}
+                   -> {"content": ..., "changes": ..., "errors": ..., "output": ...}
+
+output lists the [stream, text] pairs ("stdout" or "stderr") a resolution
+printed, so clients can print the same lines a local run would. Requests
+may carry an 'Authorization: token ...' header to resolve with that token.
+A daemon started with a client token only answers requests that carry it in
+an 'X-Tag2sha-Daemon-Token' header.
+"""
+import asyncio
+import hmac
+import http.client
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from tag2sha import aio, engine, github, pipeline, stats
+from tag2sha.cache import DEFAULT_TTLS, default_cache_dir, get_fact_cache
+from tag2sha.refs import MODE_LATEST, MODE_RELEASE, Key, Resolution, is_version_pattern
+from tag2sha.server import JSONHandler, serve_until_interrupted
+
+# How long the CLI waits for a daemon before resolving on its own
+CLIENT_CONNECT_TIMEOUT = 0.5
+CLIENT_TIMEOUT = 300.0
+
+# Header carrying the shared secret of a daemon started with a client token
+CLIENT_TOKEN_HEADER = 'X-Tag2sha-Daemon-Token'
+
+
+def default_socket_path() -> str:
+    """Return the Unix socket the daemon listens on by default."""
+    return os.path.join(default_cache_dir(), 'serve.sock')
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ('local', 0)
+
+
+class _Handler(JSONHandler):
+    def _authorized(self) -> bool:
+        client_token = self.server.daemon.client_token
+        if client_token is None or hmac.compare_digest(self.headers.get(CLIENT_TOKEN_HEADER, ''), client_token):
+            return True
+        self._send_json(401, {'error': f'requires the {CLIENT_TOKEN_HEADER} of this daemon'})
+        return False
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path != '/status':
+            return self._send_json(404, {'error': f'unknown path {self.path}'})
+        self._send_json(200, self.server.daemon.status())
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        daemon = self.server.daemon
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError as e:
+            return self._send_json(400, {'error': f'invalid JSON: {e}'})
+        authorization = self.headers.get('Authorization', '')
+        token = authorization[len('token '):] if authorization.startswith('token ') else daemon.token
+
+        if self.path == '/resolve':
+            keys = [tuple(key) for key in body.get('keys', [])]
+            response = {'results': [[sha, tag, output] for (sha, tag), output in daemon.resolve(keys, token)]}
+        elif self.path == '/rewrite':
+            response = daemon.rewrite(body.get('path', '<input>'), body.get('content', ''), token,
+                                      body.get('convert_main_to_release', False), body.get('update_to_latest', False))
+        else:
+            return self._send_json(404, {'error': f'unknown path {self.path}'})
+        self._send_json(200, response)
+
+
+class Daemon:
+    """
+    Resolution server backed by the same resolver functions as the CLI.
+
+    Facts stay warm in the configured fact cache between requests, and the
+    cache is written out after every request so a restart loses nothing.
+    Resolutions are also remembered per token for as long as the fact cache
+    would keep the facts behind them (ttls), so repeated keys make no request
+    even without a persistent cache.
+
+    Anyone who can connect resolves with the daemon's token. The Unix socket
+    is only accessible to its owner; a daemon on a TCP port needs client_token.
+    """
+
+    def __init__(self, token: str = None, jobs: int = aio.DEFAULT_LIMIT,
+                 ttls: Optional[Dict[str, Optional[int]]] = None, client_token: Optional[str] = None):
+        self.token = token
+        self.jobs = jobs
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.client_token = client_token
+        self.started = time.time()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._streams = {}
+        self._memo: Dict[Tuple[Optional[str], Key], Tuple[Optional[float], Resolution, engine.Output]] = {}
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'pid': os.getpid(),
+            'uptime': round(time.time() - self.started, 1),
+            'requests': self.requests,
+            'resolved': stats.get('daemon_resolved'),
+            'memo_hits': stats.get('daemon_memo_hits'),
+            'api_requests': stats.get('requests'),
+            'api_url': github.get_api_url(),
+        }
+
+    def _output(self, output: engine.Output) -> List[List[str]]:
+        return [[self._streams.get(id(stream), 'stdout'), text] for stream, text in output if text]
+
+    def _ttl(self, key: Key) -> Optional[int]:
+        """Return how long a resolution of key is remembered: as long as its shortest-lived fact."""
+        _, ref, mode = key
+        if mode == MODE_LATEST:
+            return self.ttls['latest_release']
+        if mode == MODE_RELEASE:
+            # Converted to the latest release, or kept as a branch without one
+            return _shortest(self.ttls['latest_release'], self.ttls['branch'])
+        if is_version_pattern(ref):
+            return _shortest(self.ttls['matching_tag'], self.ttls['branch'])
+        # Any other name may be a branch
+        return self.ttls['branch']
+
+    def resolve(self, keys: List[Key], token: str = None) -> List[Tuple[Resolution, List[List[str]]]]:
+        """Resolve keys concurrently with token or the daemon's, returning each result with the output it printed."""
+        token = token or self.token
+        now = time.time()
+        results = {}
+        with self._lock:
+            for key in keys:
+                memo = self._memo.get((token, key))
+                if memo is not None and (memo[0] is None or now < memo[0]):
+                    results[key] = memo[1:]
+        missing = list(OrderedDict.fromkeys(key for key in keys if key not in results))
+        stats.incr('daemon_memo_hits', len(keys) - len(missing))
+
+        async def resolve_all():
+            async with aio.AsyncResolver(token, self.jobs) as resolver:
+                return await resolver.resolve_captured(missing)
+
+        if missing:
+            resolved = asyncio.run(resolve_all())
+            with self._lock:
+                self._memo = {memo_key: memo for memo_key, memo in self._memo.items()
+                              if memo[0] is None or now < memo[0]}
+                for key, (result, output) in resolved.items():
+                    ttl = self._ttl(key)
+                    # Failures are retried on the next request
+                    if result[0]:
+                        self._memo[(token, key)] = (None if ttl is None else now + ttl, result, output)
+            results.update(resolved)
+        self._finish(len(keys))
+        return [(results[key][0], self._output(results[key][1])) for key in keys]
+
+    def rewrite(self, path: str, content: str, token: str = None, convert_main_to_release: bool = False,
+                update_to_latest: bool = False) -> Dict[str, Any]:
+        """Rewrite the content of one workflow file."""
+        file_plan = pipeline.scan(path, content, convert_main_to_release, update_to_latest)
+        keys = pipeline.Plan([file_plan]).keys
+        resolved = dict(zip(keys, self.resolve(keys, token)))
+
+        def resolve(key):
+            result, output = resolved[key]
+            # Print each resolution's messages before its first action line, like the CLI
+            if output:
+                for stream, text in output:
+                    print(text, end='', file=sys.stderr if stream == 'stderr' else sys.stdout)
+                resolved[key] = (result, [])
+            return result
+
+        (new_content, changes, errors), output = engine.run_captured(lambda: pipeline.rewrite(file_plan, resolve))
+        return {'content': new_content, 'changes': changes, 'errors': errors, 'output': self._output(output)}
+
+    def _finish(self, resolved: int) -> None:
+        with self._lock:
+            self.requests += 1
+            stats.incr('daemon_resolved', resolved)
+            get_fact_cache().close()
+
+    def serve(self, socket_path: Optional[str] = None, port: Optional[int] = None) -> None:
+        """Serve until interrupted, on socket_path or, if port is given, on 127.0.0.1:port."""
+        if port is not None:
+            if not self.client_token:
+                raise RuntimeError("A daemon on a TCP port answers every local user with its token; "
+                                   "start it with a client token")
+            server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+            address = f'http://127.0.0.1:{server.server_address[1]}'
+        else:
+            if os.path.exists(socket_path):
+                if DaemonClient(socket_path).status() is not None:
+                    raise RuntimeError(f"A daemon is already listening on {socket_path}")
+                # Left behind by a daemon that did not shut down cleanly
+                os.unlink(socket_path)
+            os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+            old_umask = os.umask(0o177)
+            try:
+                server = _UnixHTTPServer(socket_path, _Handler)
+            finally:
+                os.umask(old_umask)
+            address = socket_path
+        server.daemon = self
+        self._streams = {id(sys.stdout): 'stdout', id(sys.stderr): 'stderr'}
+
+        print(f"tag2sha daemon listening on {address}", file=sys.stderr)
+        # Shut down cleanly on SIGTERM too, removing the socket
+        try:
+            with engine.capturing_output():
+                serve_until_interrupted(server)
+        finally:
+            server.server_close()
+            if port is None and os.path.exists(socket_path):
+                os.unlink(socket_path)
+            get_fact_cache().close()
+
+
+def _shortest(*ttls: Optional[int]) -> Optional[int]:
+    finite = [ttl for ttl in ttls if ttl is not None]
+    return min(finite) if finite else None
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class DaemonClient:
+    """
+    Client for a daemon at a Unix socket path or an http://127.0.0.1:PORT
+    address, sending client_token to daemons that require one.
+    """
+
+    def __init__(self, address: str, client_token: Optional[str] = None):
+        self.address = address
+        self.client_token = client_token
+
+    def _request(self, method: str, path: str, body: Optional[Dict] = None, token: str = None,
+                 timeout: float = CLIENT_TIMEOUT) -> Optional[Dict[str, Any]]:
+        if self.address.startswith('http://'):
+            host, _, port = self.address[len('http://'):].rstrip('/').partition(':')
+            connection = http.client.HTTPConnection(host, int(port or 80), timeout=timeout)
+        else:
+            if not os.path.exists(self.address):
+                return None
+            connection = _UnixHTTPConnection(self.address, timeout)
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'token {token}'
+        if self.client_token:
+            headers[CLIENT_TOKEN_HEADER] = self.client_token
+        try:
+            connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+            response = connection.getresponse()
+            if response.status != 200:
+                return None
+            return json.loads(response.read())
+        except (OSError, http.client.HTTPException, ValueError):
+            return None
+        finally:
+            connection.close()
+
+    def status(self) -> Optional[Dict[str, Any]]:
+        """Return the daemon's status, or None if no daemon answers."""
+        return self._request('GET', '/status', timeout=CLIENT_CONNECT_TIMEOUT)
+
+    def resolve(self, keys: List[Key], token: str = None) -> Optional[Dict[Key, Tuple[Resolution, List[List[str]]]]]:
+        """
+        Resolve keys through the daemon. Returns each key's (sha, tag) and the
+        [stream, text] output it printed, or None if the daemon could not be used.
+        """
+        response = self._request('POST', '/resolve', {'keys': [list(key) for key in keys]}, token)
+        if response is None:
+            return None
+        return {key: ((sha, tag), output) for key, (sha, tag, output) in zip(keys, response['results'])}
@@ -0,0 +1,59 @@
+"""Capture of resolver output so concurrent resolutions print deterministically."""
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, List, TextIO, Tuple
+
+# Output written by a resolution: (stream, text) pairs in the order they were written
+Output = List[Tuple[TextIO, str]]
+
+_capture = threading.local()
+
+
+class _CapturingStream:
+    """
+    Stand-in for sys.stdout/sys.stderr that buffers writes made by a thread
+    while it resolves a reference, and passes all other writes through.
+    """
+
+    def __init__(self, stream: TextIO):
+        self._stream = stream
+
+    def write(self, text: str) -> int:
+        buffer = getattr(_capture, 'buffer', None)
+        if buffer is None:
+            return self._stream.write(text)
+        buffer.append((self._stream, text))
+        return len(text)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def replay(output: Output) -> None:
+    """Write captured output to the streams it was originally written to."""
+    for stream, text in output:
+        stream.write(text)
+
+
+def run_captured(resolve: Callable[[], Any]) -> Tuple[Any, Output]:
+    """
+    Call resolve() and capture what it prints instead of writing it.
+    Only takes effect inside capturing_output().
+    """
+    _capture.buffer = []
+    try:
+        return resolve(), _capture.buffer
+    finally:
+        _capture.buffer = None
+
+
+@contextmanager
+def capturing_output():
+    """Route sys.stdout/sys.stderr through streams that run_captured() can intercept."""
+    original_streams = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = _CapturingStream(sys.stdout), _CapturingStream(sys.stderr)
+    try:
+        yield
+    finally:
+        sys.stdout, sys.stderr = original_streams
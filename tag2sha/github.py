@@ -0,0 +1,372 @@
+"""Shared, pooled HTTP session used for every GitHub API call."""
+import random
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from tag2sha import stats
+from tag2sha.cache import get_fact_cache
+from tag2sha.ratelimit import RateLimitScheduler
+from tag2sha.tokens import TokenPool
+
+DEFAULT_API_URL = 'https://api.github.com'
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_BACKOFF_CAP = 8.0
+
+# Larger response bodies are not kept for conditional requests, so that the
+# never-expiring 'http' facts cannot grow the cache without bound
+MAX_CACHED_BODY = 256 * 1024
+
+_api_url = DEFAULT_API_URL
+_graphql_url = f'{DEFAULT_API_URL}/graphql'
+_session = None
+_session_lock = threading.Lock()
+_scheduler = RateLimitScheduler()
+_token_pool: Optional[TokenPool] = None
+_policy = {
+    'connect_timeout': DEFAULT_CONNECT_TIMEOUT,
+    'read_timeout': DEFAULT_READ_TIMEOUT,
+    'deadline': None,
+    'max_retries': DEFAULT_MAX_RETRIES,
+    'backoff': DEFAULT_BACKOFF,
+    'backoff_cap': DEFAULT_BACKOFF_CAP,
+    'offline': False,
+}
+
+
+class DeadlineExceeded(Exception):
+    """The overall deadline for API traffic of this run has passed."""
+
+
+class NetworkDisabled(requests.RequestException):
+    """A request was needed, but the run is offline."""
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        stats.incr('connections_opened')
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        stats.incr('connections_opened')
+        return super()._new_conn()
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools count every new connection they open."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+
+def configure_session(pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                      pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                      keep_alive: bool = True) -> requests.Session:
+    """
+    Create the shared session used by all API calls.
+
+    Args:
+        pool_connections: Number of per-host connection pools to keep
+        pool_maxsize: Maximum number of connections kept open to a single host;
+            callers block rather than exceed it
+        keep_alive: Reuse connections between requests
+    """
+    global _session
+    session = requests.Session()
+    adapter = _CountingAdapter(pool_connections=pool_connections,
+                               pool_maxsize=pool_maxsize,
+                               pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+
+    with _session_lock:
+        old_session, _session = _session, session
+    if old_session is not None:
+        old_session.close()
+    return session
+
+
+def get_session() -> requests.Session:
+    """Return the shared session, creating it with defaults if needed."""
+    with _session_lock:
+        session = _session
+    if session is None:
+        session = configure_session()
+    return session
+
+
+def configure_api_url(api_url: str, graphql_url: Optional[str] = None) -> str:
+    """
+    Set the base URL of every REST API request, e.g. a GitHub Enterprise
+    Server's 'https://github.example.com/api/v3' or a 'tag2sha proxy', and the
+    URL of GraphQL queries.
+
+    Without graphql_url, a GitHub Enterprise Server's '/api/v3' maps to its
+    '/api/graphql'; any other base URL, such as a proxy that only serves REST
+    requests, leaves GraphQL queries on the public API.
+    """
+    global _api_url, _graphql_url
+    _api_url = api_url.rstrip('/')
+    if graphql_url is None:
+        if _api_url.endswith('/api/v3'):
+            graphql_url = _api_url[:-len('/v3')] + '/graphql'
+        else:
+            graphql_url = f'{DEFAULT_API_URL}/graphql'
+    _graphql_url = graphql_url
+    return _api_url
+
+
+def get_api_url() -> str:
+    """Return the base URL of API requests."""
+    return _api_url
+
+
+def configure_rate_limit(scheduler: RateLimitScheduler) -> RateLimitScheduler:
+    """Install the scheduler that every API request goes through."""
+    global _scheduler
+    _scheduler = scheduler
+    return scheduler
+
+
+def configure_token_pool(token_pool: Optional[TokenPool]) -> Optional[TokenPool]:
+    """
+    Spread REST API requests over the tokens of token_pool, each scheduled
+    within its own rate limit, instead of using the token of each call and the
+    shared scheduler. GraphQL queries are left alone. None switches back.
+    """
+    global _token_pool
+    _token_pool = token_pool
+    return token_pool
+
+
+def configure_requests(connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                       read_timeout: float = DEFAULT_READ_TIMEOUT,
+                       deadline: Optional[float] = None,
+                       max_retries: int = DEFAULT_MAX_RETRIES,
+                       backoff: float = DEFAULT_BACKOFF,
+                       backoff_cap: float = DEFAULT_BACKOFF_CAP,
+                       offline: bool = False) -> None:
+    """
+    Set timeouts and the retry policy for all API requests.
+
+    Args:
+        connect_timeout: Seconds to wait for a connection to be established
+        read_timeout: Seconds to wait for the server between bytes of a response
+        deadline: Seconds from now after which no request is started or retried
+        max_retries: Retries of a GET after a connection error, timeout or 5xx response
+        backoff: Base delay of the exponential backoff between retries
+        backoff_cap: Maximum delay between retries
+        offline: Make no requests at all; conditional GETs are answered from
+            their stored responses, however old, and any other request raises
+            NetworkDisabled
+    """
+    _policy.update(
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        deadline=time.monotonic() + deadline if deadline is not None else None,
+        max_retries=max_retries,
+        backoff=backoff,
+        backoff_cap=backoff_cap,
+        offline=offline,
+    )
+
+
+def _time_left() -> Optional[float]:
+    """Return the seconds left until the deadline, raising DeadlineExceeded once it has passed."""
+    if _policy['deadline'] is None:
+        return None
+    left = _policy['deadline'] - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("Deadline for GitHub API requests exceeded")
+    return left
+
+
+def request_timeout() -> Tuple[float, float]:
+    """
+    Return the (connect, read) timeouts for a request starting now, with the
+    read timeout cut to the time left until the deadline.
+    """
+    left = _time_left()
+    read_timeout = _policy['read_timeout'] if left is None else min(_policy['read_timeout'], left)
+    return _policy['connect_timeout'], read_timeout
+
+
+def _backoff(retry: int, reason: str, path: str) -> None:
+    """Sleep before a retry, using capped exponential backoff with full jitter."""
+    delay = random.uniform(0, min(_policy['backoff_cap'], _policy['backoff'] * 2 ** retry))
+    left = _time_left()
+    if left is not None and delay >= left:
+        raise DeadlineExceeded(f"Deadline for GitHub API requests exceeded while retrying {path}")
+    stats.incr('retries')
+    print(f"Warning: {reason} for {path}, retrying in {delay:.1f}s", file=sys.__stderr__)
+    time.sleep(delay)
+
+
+def _send(method: str, path: str, headers: Dict[str, str], json_body: Optional[Dict] = None) -> requests.Response:
+    """
+    Send a request once the rate-limit scheduler allows it.
+
+    Rate-limited responses are retried as the scheduler directs. GETs are
+    idempotent, so they are also retried after connection errors, timeouts and
+    5xx responses.
+    """
+    if _policy['offline']:
+        raise NetworkDisabled(f"{method} {path} needs the network, but the run is offline")
+    resource = 'graphql' if path == '/graphql' else 'core'
+    rate_limit_attempt = 0
+    retry = 0
+    while True:
+        timeout = request_timeout()
+        if _token_pool is not None and resource == 'core':
+            # Chosen again on every attempt, so a rate-limited token is swapped for another.
+            # GraphQL batches keep the token they were given, under the shared scheduler
+            token, scheduler = _token_pool.select(resource)
+            request_headers = dict(headers, Authorization=f'token {token}')
+        else:
+            scheduler, request_headers = _scheduler, headers
+        scheduler.acquire(resource)
+        stats.incr('requests')
+        if _token_pool is not None and resource == 'core':
+            _token_pool.record(token)
+        try:
+            url = _graphql_url if resource == 'graphql' else f'{_api_url}{path}'
+            response = get_session().request(method, url, headers=request_headers, json=json_body,
+                                             timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            scheduler.release(resource)
+            if method != 'GET' or retry >= _policy['max_retries']:
+                raise
+            _backoff(retry, type(e).__name__, path)
+            retry += 1
+            continue
+        except BaseException:
+            scheduler.release(resource)
+            raise
+
+        delay = scheduler.update(resource, response, rate_limit_attempt)
+        if response.status_code >= 500 and method == 'GET' and retry < _policy['max_retries']:
+            _backoff(retry, f"HTTP {response.status_code}", path)
+            retry += 1
+            continue
+
+        if delay is None:
+            return response
+        rate_limit_attempt += 1
+        time.sleep(delay)
+
+
+def api_get(path: str, token: str = None, headers: Optional[Dict[str, str]] = None,
+            conditional: bool = False) -> requests.Response:
+    """
+    GET a GitHub API path (e.g. '/repos/actions/checkout/tags') over the shared session.
+
+    With conditional=True, the ETag and Last-Modified of the previous 200
+    response for the same path are sent back, and a 304 answer is turned into
+    a 200 response carrying the stored body. GitHub does not count 304s
+    against the rate limit. Bodies over MAX_CACHED_BODY bytes are not stored.
+    """
+    request_headers = _request_headers(token, headers)
+
+    validators = None
+    if conditional:
+        validators = get_fact_cache().get('http', '', path)
+        if validators and _policy['offline']:
+            return _stored_response(None, validators)
+        if validators:
+            if validators.get('etag'):
+                request_headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                request_headers['If-Modified-Since'] = validators['last_modified']
+
+    response = _send('GET', path, request_headers)
+
+    if conditional:
+        if response.status_code == 304 and validators:
+            stats.incr('not_modified')
+            return _stored_response(response, validators)
+        if (response.status_code == 200 and len(response.content) <= MAX_CACHED_BODY
+                and ('ETag' in response.headers or 'Last-Modified' in response.headers)):
+            get_fact_cache().set('http', '', path, {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'link': response.headers.get('Link'),
+                'body': response.text,
+            })
+    return response
+
+
+def api_post(path: str, json_body: Dict, token: str = None) -> requests.Response:
+    """POST a JSON body to a GitHub API path (e.g. '/graphql') over the shared session."""
+    return _send('POST', path, _request_headers(token), json_body)
+
+
+def _request_headers(token: str = None, headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    request_headers = {}
+    if token:
+        request_headers['Authorization'] = f'token {token}'
+    if headers:
+        request_headers.update(headers)
+    return request_headers
+
+
+def _stored_response(not_modified: Optional[requests.Response], validators: Dict[str, str]) -> requests.Response:
+    """Build a 200 response from a 304 answer, or from nothing when offline, and the stored body."""
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = 'OK'
+    if not_modified is not None:
+        response.headers.update(not_modified.headers)
+        response.headers.pop('Content-Length', None)
+        response.url = not_modified.url
+        response.request = not_modified.request
+    if validators.get('link'):
+        response.headers['Link'] = validators['link']
+    response._content = validators['body'].encode('utf-8')
+    response.encoding = 'utf-8'
+    return response
+
+
+def token_summary() -> List[str]:
+    """Describe the requests made with each token of the pool, if one is configured."""
+    return _token_pool.summary() if _token_pool is not None else []
+
+
+def network_summary() -> str:
+    """Describe the API traffic of this run."""
+    requests_made = stats.get('requests')
+    opened = stats.get('connections_opened')
+    # ls-refs requests share the session and its connections
+    git_requests = stats.get('ls_refs_requests')
+    reused = max(requests_made + git_requests - opened, 0)
+    summary = (f"{requests_made} API requests ({stats.get('not_modified')} answered 304 Not Modified), "
+               f"{opened} connections opened, {reused} reused")
+    if git_requests:
+        summary += f"; {git_requests} ls-refs requests"
+    if stats.get('retries'):
+        summary += f"; {stats.get('retries')} retries"
+    rate_limited = stats.get('rate_limit_waits') + stats.get('secondary_rate_limits') + stats.get('rate_limit_paced')
+    if rate_limited:
+        summary += (f"; rate limit: {stats.get('rate_limit_paced')} paced, "
+                    f"{stats.get('secondary_rate_limits')} secondary limit retries, "
+                    f"{stats.get('rate_limit_waits')} waits for reset")
+    return summary
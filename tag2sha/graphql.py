@@ -0,0 +1,128 @@
+"""Batch resolution of action references through the GitHub GraphQL API."""
+import json
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from tag2sha import stats
+from tag2sha.cache import get_fact_cache
+from tag2sha.github import api_post
+from tag2sha.refs import MODE_LATEST, MODE_PIN, MODE_RELEASE, Key, Resolution, group_by_repo, is_version_pattern, select_matching_tag
+
+# GitHub allows many more, but 100 repositories keeps each query well inside
+# the node and complexity limits
+MAX_REPOS_PER_QUERY = 100
+
+# Resolve a ref to its object, peeling annotated tags to the commit they point to
+TARGET_FIELDS = 'target { oid ... on Tag { target { oid } } }'
+
+
+def build_query(repo_keys: List[Tuple[str, List[Key]]]) -> str:
+    """Build one aliased query covering every key of the given repositories."""
+    lines = ['query {']
+    for i, (repo, keys) in enumerate(repo_keys):
+        owner, name = repo.split('/', 1)
+        lines.append(f'  r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{')
+        if any(mode in (MODE_LATEST, MODE_RELEASE) for _, _, mode in keys):
+            lines.append('    latestRelease { tagName tagCommit { oid } }')
+        for j, (_, ref, mode) in enumerate(keys):
+            if mode != MODE_PIN:
+                continue
+            if is_version_pattern(ref):
+                lines.append(f'    m{j}: refs(refPrefix: "refs/tags/", query: {json.dumps(ref)}, first: 100) '
+                             f'{{ pageInfo {{ hasNextPage }} nodes {{ name {TARGET_FIELDS} }} }}')
+            else:
+                lines.append(f'    t{j}: ref(qualifiedName: {json.dumps("refs/tags/" + ref)}) {{ {TARGET_FIELDS} }}')
+                lines.append(f'    h{j}: ref(qualifiedName: {json.dumps("refs/heads/" + ref)}) {{ {TARGET_FIELDS} }}')
+        lines.append('  }')
+    lines.append('}')
+    return '\n'.join(lines)
+
+
+def peeled_oid(ref: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Return the commit a ref points to, looking through annotated tags."""
+    if not ref or not ref.get('target'):
+        return None
+    target = ref['target']
+    if target.get('target'):
+        return target['target']['oid']
+    return target.get('oid')
+
+
+def resolve_repo(repo: str, keys: List[Key], data: Dict[str, Any]) -> Dict[Key, Resolution]:
+    """Extract the resolutions of one repository's keys from its query result."""
+    facts = get_fact_cache()
+    resolved = {}
+    release = data.get('latestRelease')
+    for j, key in enumerate(keys):
+        _, ref, mode = key
+        if mode == MODE_LATEST or mode == MODE_RELEASE:
+            if release and release.get('tagCommit'):
+                sha = release['tagCommit']['oid']
+                facts.set('latest_release', repo, '', release['tagName'])
+                facts.set('tag', repo, release['tagName'], sha)
+                resolved[key] = (sha, release['tagName'])
+        elif is_version_pattern(ref):
+            refs = data.get(f'm{j}')
+            # A partial listing could miss the newest match, leave it to REST
+            if not refs or refs['pageInfo']['hasNextPage']:
+                continue
+            oids = {node['name']: peeled_oid(node) for node in refs['nodes']}
+            latest_tag = select_matching_tag(list(oids), ref)
+            if latest_tag and oids[latest_tag]:
+                facts.set('matching_tag', repo, ref, latest_tag)
+                facts.set('tag', repo, latest_tag, oids[latest_tag])
+                resolved[key] = (oids[latest_tag], latest_tag)
+        else:
+            tag_sha = peeled_oid(data.get(f't{j}'))
+            branch_sha = peeled_oid(data.get(f'h{j}'))
+            if tag_sha:
+                facts.set('tag', repo, ref, tag_sha)
+                resolved[key] = (tag_sha, ref)
+            elif branch_sha:
+                facts.set('branch', repo, ref, branch_sha)
+                resolved[key] = (branch_sha, ref)
+    return resolved
+
+
+def _warn_failed(chunk: List[Tuple[str, List[Key]]], detail: str) -> None:
+    print(f"Warning: GraphQL query failed, falling back to REST for {len(chunk)} repositories", file=sys.stderr)
+    print(detail, file=sys.stderr)
+
+
+def resolve_batch(keys: List[Key], token: str) -> Dict[Key, Resolution]:
+    """
+    Resolve (base_repo, ref, mode) keys with aliased GraphQL queries, up to
+    MAX_REPOS_PER_QUERY repositories per request.
+
+    Returns the (sha, resolved_ref) of every key that could be resolved. Keys
+    missing from the result, including all keys of a failed query, should be
+    resolved through the REST API instead.
+    """
+    repos = list(group_by_repo(keys).items())
+
+    resolved = {}
+    for start in range(0, len(repos), MAX_REPOS_PER_QUERY):
+        chunk = repos[start:start + MAX_REPOS_PER_QUERY]
+        stats.incr('graphql_queries')
+        try:
+            response = api_post('/graphql', {'query': build_query(chunk)}, token)
+        except requests.RequestException as e:
+            # POSTs are not retried; the keys of a failed query are left to REST
+            _warn_failed(chunk, f"Request failed: {e}")
+            continue
+        if response.status_code != 200:
+            _warn_failed(chunk, f"API response: {response.status_code} - {response.text}")
+            continue
+        try:
+            data = response.json().get('data') or {}
+        except ValueError as e:
+            _warn_failed(chunk, f"Invalid JSON response: {e}")
+            continue
+
+        for i, (repo, repo_keys) in enumerate(chunk):
+            # Unknown or inaccessible repositories come back as null
+            if data.get(f'r{i}'):
+                resolved.update(resolve_repo(repo, repo_keys, data[f'r{i}']))
+    return resolved
@@ -0,0 +1,100 @@
+"""Lockfile recording the resolution of every reference, for deterministic re-runs."""
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from tag2sha.refs import MODE_LATEST, MODE_PIN, MODE_RELEASE, Key, Resolution
+
+DEFAULT_LOCKFILE = 'tag2sha.lock'
+DEFAULT_LOCK_MAX_AGE = 24 * 60 * 60
+
+LOCKFILE_FORMAT_VERSION = 1
+
+
+class LockfileError(Exception):
+    """The lockfile exists but cannot be used."""
+
+
+def lock_name(key: Key) -> str:
+    """Name a resolution key in the lockfile, e.g. 'actions/checkout@v4'."""
+    base_repo, ref, mode = key
+    return base_repo if mode == MODE_LATEST else f"{base_repo}@{ref}"
+
+
+class Lockfile:
+    """
+    The resolved tag and commit SHA of each resolution key, grouped by mode,
+    with the time each was resolved.
+
+    Entries are sorted when written so that the file diffs cleanly under
+    version control.
+    """
+
+    def __init__(self, path: str = DEFAULT_LOCKFILE):
+        self.path = path
+        self._entries: Dict[str, Dict[str, Dict[str, Any]]] = {MODE_PIN: {}, MODE_RELEASE: {}, MODE_LATEST: {}}
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            raise LockfileError(f"Could not read lockfile {self.path}: {e}")
+        if data.get('version') != LOCKFILE_FORMAT_VERSION:
+            raise LockfileError(f"Unsupported lockfile version {data.get('version')!r} in {self.path}")
+        for mode, entries in data.get('references', {}).items():
+            self._entries.setdefault(mode, {}).update(entries)
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    def get(self, key: Key, max_age: Optional[float] = None) -> Optional[Resolution]:
+        """
+        Return the locked (sha, tag) of a key, or None if it is not locked or,
+        with max_age, was resolved more than max_age seconds ago.
+        """
+        entry = self._entries.get(key[2], {}).get(lock_name(key))
+        if entry is None:
+            return None
+        if max_age is not None:
+            resolved_at = datetime.fromisoformat(entry['resolved_at'])
+            if (datetime.now(timezone.utc) - resolved_at).total_seconds() > max_age:
+                return None
+        return entry['sha'], entry['tag']
+
+    def record(self, key: Key, result: Resolution) -> None:
+        """Lock a key to the (sha, tag) it resolved to; failed resolutions are not recorded."""
+        sha, tag = result
+        if not sha:
+            return
+        self._entries.setdefault(key[2], {})[lock_name(key)] = {
+            'tag': tag,
+            'sha': sha,
+            'resolved_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        }
+        self._dirty = True
+
+    def save(self) -> bool:
+        """Write the lockfile if any entry changed. Returns True if it was written."""
+        if not self._dirty:
+            return False
+        references = {mode: dict(sorted(entries.items())) for mode, entries in self._entries.items() if entries}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tag2sha-', suffix='.lock.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': LOCKFILE_FORMAT_VERSION, 'references': references}, f, indent=2)
+                f.write('\n')
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Warning: Could not write lockfile {self.path}: {e}", file=sys.stderr)
+            return False
+        self._dirty = False
+        return True
@@ -0,0 +1,143 @@
+"""Resolution of action references through the git protocol v2 ls-refs command over smart HTTP."""
+import sys
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import requests
+
+from tag2sha import stats
+from tag2sha.github import get_session, request_timeout
+from tag2sha.lsremote import DEFAULT_GIT_BASE_URL, RefSet, resolve_listed
+from tag2sha.refs import MODE_LATEST, MODE_RELEASE, Key, Resolution, is_version_pattern
+
+# Special pkt-lines: end of a message, and the separator between a command's capabilities and arguments
+FLUSH_PKT = b'0000'
+DELIM_PKT = b'0001'
+
+UPLOAD_PACK_REQUEST = 'application/x-git-upload-pack-request'
+UPLOAD_PACK_RESULT = 'application/x-git-upload-pack-result'
+
+
+class ProtocolError(Exception):
+    """The server sent something other than a well-formed protocol v2 response."""
+
+
+def pkt_line(data: str) -> bytes:
+    """Frame data as a pkt-line: four hex digits of total length, then the payload."""
+    payload = data.encode()
+    return f'{len(payload) + 4:04x}'.encode() + payload
+
+
+def iter_pkt_lines(chunks: Iterable[bytes]) -> Iterator[Optional[bytes]]:
+    """
+    Parse pkt-lines from a stream of byte chunks as they arrive.
+    Yields each payload, or None for a flush, delimiter or response-end packet.
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= 4:
+            try:
+                length = int(buffer[:4], 16)
+            except ValueError:
+                raise ProtocolError(f"invalid pkt-line length {bytes(buffer[:4])!r}")
+            if length < 4:
+                del buffer[:4]
+                yield None
+                continue
+            if len(buffer) < length:
+                break
+            payload = bytes(buffer[4:length])
+            del buffer[:length]
+            if payload.startswith(b'ERR '):
+                raise ProtocolError(payload[4:].decode(errors='replace').strip())
+            yield payload
+    if buffer:
+        raise ProtocolError("truncated pkt-line")
+
+
+def build_ls_refs_request(prefixes: Iterable[str]) -> bytes:
+    """Build an ls-refs request for refs under the given prefixes, asking for peeled tags."""
+    lines = [pkt_line('command=ls-refs\n'), pkt_line('agent=tag2sha\n'), DELIM_PKT, pkt_line('peel\n')]
+    lines.extend(pkt_line(f'ref-prefix {prefix}\n') for prefix in prefixes)
+    lines.append(FLUSH_PKT)
+    return b''.join(lines)
+
+
+def parse_ref_line(line: bytes, tags: Dict[str, str], heads: Dict[str, str]) -> None:
+    """Record one '<oid> <refname> [peeled:<oid>]' line of an ls-refs response."""
+    oid, name, *attributes = line.decode().rstrip('\n').split(' ')
+    for attribute in attributes:
+        if attribute.startswith('peeled:'):
+            oid = attribute[len('peeled:'):]
+    if name.startswith('refs/tags/'):
+        tags[name[len('refs/tags/'):]] = oid
+    elif name.startswith('refs/heads/'):
+        heads[name[len('refs/heads/'):]] = oid
+
+
+def ref_prefixes(keys: List[Key]) -> List[str]:
+    """Return the ref prefixes needed to resolve one repository's keys."""
+    prefixes = []
+    for _, ref, mode in keys:
+        if mode == MODE_LATEST or mode == MODE_RELEASE:
+            prefixes.append('refs/tags/')
+            if ref:
+                prefixes.append(f'refs/heads/{ref}')
+        else:
+            prefixes.append(f'refs/tags/{ref}')
+            # A major version like 'v4' is looked up among the tags only
+            if not is_version_pattern(ref):
+                prefixes.append(f'refs/heads/{ref}')
+    return list(OrderedDict.fromkeys(prefixes))
+
+
+def ls_refs(repo: str, prefixes: List[str], token: str = None, base_url: str = DEFAULT_GIT_BASE_URL,
+            timeout: Union[float, Tuple[float, float], None] = None) -> Optional[RefSet]:
+    """
+    List the refs of a repository under the given prefixes with one ls-refs
+    request over the shared session, by default with the configured API timeouts.
+    Returns None if the refs could not be listed.
+    """
+    url = f"{base_url.rstrip('/')}/{repo}.git/git-upload-pack"
+    headers = {
+        'Content-Type': UPLOAD_PACK_REQUEST,
+        'Accept': UPLOAD_PACK_RESULT,
+        'Git-Protocol': 'version=2',
+    }
+    auth = ('x-access-token', token) if token and url.startswith('https://') else None
+    stats.incr('ls_refs_requests')
+    tags, heads = {}, {}
+    try:
+        with get_session().post(url, data=build_ls_refs_request(prefixes), headers=headers, auth=auth,
+                                timeout=timeout if timeout is not None else request_timeout(),
+                                stream=True) as response:
+            if response.status_code != 200:
+                print(f"Warning: ls-refs failed for {repo}: HTTP {response.status_code}", file=sys.stderr)
+                return None
+            if response.headers.get('Content-Type') != UPLOAD_PACK_RESULT:
+                # Not a smart HTTP server, or one that does not speak protocol v2
+                print(f"Warning: ls-refs failed for {repo}: unexpected response type "
+                      f"{response.headers.get('Content-Type')}", file=sys.stderr)
+                return None
+            for line in iter_pkt_lines(response.iter_content(chunk_size=8192)):
+                if line is None:
+                    break
+                parse_ref_line(line, tags, heads)
+    except (requests.RequestException, ProtocolError, ValueError) as e:
+        print(f"Warning: ls-refs failed for {repo}: {e}", file=sys.stderr)
+        return None
+    return RefSet(tags, heads)
+
+
+def resolve_batch(keys: List[Key], token: str = None, base_url: str = DEFAULT_GIT_BASE_URL,
+                  jobs: int = 1) -> Dict[Key, Resolution]:
+    """
+    Resolve (base_repo, ref, mode) keys with one ls-refs request per repository,
+    limited to the ref prefixes the keys need, up to jobs repositories at a time.
+
+    Returns the (sha, resolved_ref) of every key that could be resolved. Keys
+    missing from the result should be resolved through the REST API instead.
+    """
+    return resolve_listed(keys, lambda repo, repo_keys: ls_refs(repo, ref_prefixes(repo_keys), token, base_url),
+                          jobs)
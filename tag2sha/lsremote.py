@@ -0,0 +1,143 @@
+"""Resolution of action references from the git ref advertisement, without the REST API."""
+import base64
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from tag2sha import stats
+from tag2sha.cache import get_fact_cache
+from tag2sha.refs import MODE_LATEST, MODE_RELEASE, Key, Resolution, group_by_repo, is_version_pattern, parse_version, select_latest_tag, select_matching_tag
+
+DEFAULT_GIT_BASE_URL = 'https://github.com'
+DEFAULT_TIMEOUT = 60.0
+
+
+class RefSet(NamedTuple):
+    """The tags and branches of a repository, with annotated tags peeled to their commits."""
+    tags: Dict[str, str]
+    heads: Dict[str, str]
+
+
+def parse_ref_advertisement(output: str) -> RefSet:
+    """Parse 'sha<TAB>refname' lines, preferring the peeled '^{}' entry of annotated tags."""
+    tags, heads, peeled = {}, {}, {}
+    for line in output.splitlines():
+        sha, _, name = line.partition('\t')
+        if name.startswith('refs/tags/'):
+            name = name[len('refs/tags/'):]
+            if name.endswith('^{}'):
+                peeled[name[:-3]] = sha
+            else:
+                tags[name] = sha
+        elif name.startswith('refs/heads/'):
+            heads[name[len('refs/heads/'):]] = sha
+    tags.update((name, sha) for name, sha in peeled.items() if name in tags)
+    return RefSet(tags, heads)
+
+
+def git_env(url: str, token: Optional[str]) -> Dict[str, str]:
+    """Return the environment for a git command talking to url, authenticated with token."""
+    env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+    if token and url.startswith('https://'):
+        # Pass the token through the environment so it stays out of the process list
+        credentials = base64.b64encode(f'x-access-token:{token}'.encode()).decode()
+        env.update(GIT_CONFIG_COUNT='1', GIT_CONFIG_KEY_0='http.extraHeader',
+                   GIT_CONFIG_VALUE_0=f'Authorization: Basic {credentials}')
+    return env
+
+
+def ls_remote(repo: str, token: str = None, base_url: str = DEFAULT_GIT_BASE_URL,
+              timeout: float = DEFAULT_TIMEOUT) -> Optional[RefSet]:
+    """
+    List the tags and branches of a repository with one 'git ls-remote' round trip.
+    Returns None if the repository could not be listed.
+    """
+    url = f"{base_url.rstrip('/')}/{repo}.git"
+    stats.incr('ls_remote_calls')
+    try:
+        result = subprocess.run(['git', 'ls-remote', '--tags', '--heads', url],
+                                capture_output=True, text=True, timeout=timeout, env=git_env(url, token))
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"Warning: git ls-remote failed for {repo}: {e}", file=sys.stderr)
+        return None
+    if result.returncode != 0:
+        message = result.stderr.strip().splitlines()
+        print(f"Warning: git ls-remote failed for {repo}: {message[0] if message else result.returncode}",
+              file=sys.stderr)
+        return None
+    return parse_ref_advertisement(result.stdout)
+
+
+def select_latest_release(tag_names: List[str]) -> Optional[str]:
+    """
+    Stand in for the latest release: the highest semantic version that is not a
+    pre-release, or the highest of all tags if every version is a pre-release.
+    """
+    stable = [name for name in tag_names
+              if parse_version(name) is not None and not parse_version(name).prerelease]
+    return select_latest_tag(stable or tag_names)
+
+
+def resolve_repo(repo: str, keys: List[Key], refs: RefSet) -> Dict[Key, Resolution]:
+    """Resolve one repository's keys from its tags and branches."""
+    facts = get_fact_cache()
+    resolved = {}
+    for key in keys:
+        _, ref, mode = key
+        if mode == MODE_LATEST or mode == MODE_RELEASE:
+            latest_tag = select_latest_release(list(refs.tags))
+            if latest_tag:
+                resolved[key] = (refs.tags[latest_tag], latest_tag)
+            elif mode == MODE_RELEASE and ref in refs.heads:
+                # No release to convert to, keep the branch like the REST resolver
+                resolved[key] = (refs.heads[ref], ref)
+            continue
+
+        if is_version_pattern(ref):
+            latest_tag = select_matching_tag(list(refs.tags), ref)
+            if latest_tag:
+                facts.set('matching_tag', repo, ref, latest_tag)
+                facts.set('tag', repo, latest_tag, refs.tags[latest_tag])
+                resolved[key] = (refs.tags[latest_tag], latest_tag)
+                continue
+
+        if ref in refs.tags:
+            facts.set('tag', repo, ref, refs.tags[ref])
+            resolved[key] = (refs.tags[ref], ref)
+        elif ref in refs.heads:
+            facts.set('branch', repo, ref, refs.heads[ref])
+            resolved[key] = (refs.heads[ref], ref)
+    return resolved
+
+
+def resolve_listed(keys: List[Key], list_refs: Callable[[str, List[Key]], Optional[RefSet]],
+                   jobs: int = 1) -> Dict[Key, Resolution]:
+    """
+    Resolve keys from the refs that list_refs(repo, repo_keys) lists for each of
+    their repositories, up to jobs repositories at a time. The keys of a
+    repository whose refs could not be listed (None) are left out.
+    """
+    by_repo = group_by_repo(keys)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        ref_sets = dict(zip(by_repo, executor.map(lambda item: list_refs(*item), by_repo.items())))
+
+    resolved = {}
+    for repo, repo_keys in by_repo.items():
+        if ref_sets[repo] is not None:
+            resolved.update(resolve_repo(repo, repo_keys, ref_sets[repo]))
+    return resolved
+
+
+def resolve_batch(keys: List[Key], token: str = None, base_url: str = DEFAULT_GIT_BASE_URL,
+                  jobs: int = 1) -> Dict[Key, Resolution]:
+    """
+    Resolve (base_repo, ref, mode) keys with one ls-remote per repository, up to
+    jobs repositories at a time.
+
+    Returns the (sha, resolved_ref) of every key that could be resolved. Keys
+    missing from the result, including all keys of a repository that could not
+    be listed, should be resolved through the REST API instead.
+    """
+    return resolve_listed(keys, lambda repo, _: ls_remote(repo, token, base_url), jobs)
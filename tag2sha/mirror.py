@@ -0,0 +1,127 @@
+"""Local bare mirrors of frequently used action repositories."""
+import fnmatch
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from tag2sha import stats
+from tag2sha.cache import default_cache_dir
+from tag2sha.lsremote import DEFAULT_GIT_BASE_URL, DEFAULT_TIMEOUT, RefSet, git_env, resolve_listed
+from tag2sha.refs import Key, Resolution
+
+DEFAULT_MIRROR_REPOS = ['actions/*', 'docker/*', 'aws-actions/*']
+DEFAULT_REFRESH_INTERVAL = 15 * 60
+
+# Commits and annotated tags are all that resolution needs, so skip trees and blobs
+FETCH_FILTER = 'tree:0'
+
+
+def default_mirror_dir() -> str:
+    """Return the directory for mirrors inside the per-user cache directory."""
+    return os.path.join(default_cache_dir(), 'mirrors')
+
+
+class MirrorStore:
+    """
+    Bare mirrors of the repositories matching patterns, kept under root.
+
+    A mirror is created on first use and refreshed with an incremental fetch
+    of its branches and tags once its last fetch is older than
+    refresh_interval. Its refs are then read locally, with annotated tags
+    peeled, so resolving any number of references costs at most one fetch.
+    """
+
+    def __init__(self, root: str = None, patterns: Optional[List[str]] = None,
+                 base_url: str = DEFAULT_GIT_BASE_URL, refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+                 token: str = None, offline: bool = False, timeout: float = DEFAULT_TIMEOUT):
+        self.root = root or default_mirror_dir()
+        self.patterns = DEFAULT_MIRROR_REPOS if patterns is None else patterns
+        self.base_url = base_url.rstrip('/')
+        self.refresh_interval = refresh_interval
+        self.token = token
+        self.offline = offline
+        self.timeout = timeout
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def covers(self, repo: str) -> bool:
+        """Return True if repo is one of the mirrored repositories."""
+        return any(fnmatch.fnmatch(repo, pattern) for pattern in self.patterns)
+
+    def path(self, repo: str) -> str:
+        return os.path.join(self.root, f'{repo}.git')
+
+    def _git(self, repo: str, *args: str) -> Optional[str]:
+        url = f'{self.base_url}/{repo}.git'
+        try:
+            result = subprocess.run(['git', '--git-dir', self.path(repo)] + list(args), capture_output=True,
+                                    text=True, timeout=self.timeout, env=git_env(url, self.token))
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"Warning: git {args[0]} failed for the mirror of {repo}: {e}", file=sys.stderr)
+            return None
+        if result.returncode != 0:
+            message = result.stderr.strip().splitlines()
+            print(f"Warning: git {args[0]} failed for the mirror of {repo}: "
+                  f"{message[-1] if message else result.returncode}", file=sys.stderr)
+            return None
+        return result.stdout
+
+    def _last_fetch(self, repo: str) -> Optional[float]:
+        try:
+            return os.path.getmtime(os.path.join(self.path(repo), 'FETCH_HEAD'))
+        except OSError:
+            return None
+
+    def update(self, repo: str) -> bool:
+        """
+        Create the mirror of repo or fetch what changed, if its last fetch is
+        older than the refresh interval. Returns True if the mirror has refs.
+        """
+        with self._locks_lock:
+            lock = self._locks.setdefault(repo, threading.Lock())
+        with lock:
+            last_fetch = self._last_fetch(repo)
+            if self.offline or (last_fetch is not None and time.time() - last_fetch < self.refresh_interval):
+                return last_fetch is not None
+
+            if not os.path.isdir(self.path(repo)):
+                os.makedirs(os.path.dirname(self.path(repo)), exist_ok=True)
+                if (self._git(repo, 'init', '--bare', '--quiet') is None
+                        or self._git(repo, 'config', 'remote.origin.url', f'{self.base_url}/{repo}.git') is None):
+                    return False
+
+            stats.incr('mirror_fetches')
+            # Every fetch rewrites FETCH_HEAD, whose modification time then records the refresh
+            fetched = self._git(repo, 'fetch', '--quiet', '--prune', '--filter', FETCH_FILTER,
+                                'origin', '+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*')
+            return fetched is not None or last_fetch is not None
+
+    def refs(self, repo: str) -> Optional[RefSet]:
+        """Read the tags and branches of an up-to-date mirror, with annotated tags peeled."""
+        if not self.update(repo):
+            return None
+        output = self._git(repo, 'for-each-ref', '--format=%(objectname) %(*objectname) %(refname)',
+                           'refs/tags', 'refs/heads')
+        if output is None:
+            return None
+        tags, heads = {}, {}
+        for line in output.splitlines():
+            oid, peeled, name = line.split(' ', 2)
+            if name.startswith('refs/tags/'):
+                tags[name[len('refs/tags/'):]] = peeled or oid
+            elif name.startswith('refs/heads/'):
+                heads[name[len('refs/heads/'):]] = oid
+        return RefSet(tags, heads)
+
+    def resolve_batch(self, keys: List[Key], jobs: int = 1) -> Dict[Key, Resolution]:
+        """
+        Resolve the keys of mirrored repositories from their local refs,
+        updating up to jobs mirrors at a time.
+
+        Returns the (sha, resolved_ref) of every key that could be resolved;
+        keys of other repositories are left to the other resolvers.
+        """
+        return resolve_listed([key for key in keys if self.covers(key[0])], lambda repo, _: self.refs(repo), jobs)
@@ -0,0 +1,169 @@
+"""
+Plan, resolve and apply the rewrites of a run.
+
+A run first scans every workflow file into a Plan of reference sites, then
+resolves the unique resolution keys of the whole plan in bulk, and finally
+rewrites and writes the files from the resolved keys.
+"""
+import mmap
+import re
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from tag2sha import stats
+from tag2sha.refs import MODE_LATEST, Key, Resolution
+from tag2sha.resolver import parse_action_repo, resolution_key
+
+# Regular expression to match GitHub action references
+# Matches patterns like: uses: owner/repo@tag or uses: owner/repo/variant@sha  # tag
+# The match ends before the line break, so rewriting a site keeps the newline
+# before a blank line or at the end of the file, and the '\r' of CRLF files
+ACTION_PATTERN = re.compile(r'(\s+uses:\s+)([^@\s]+)@([^#\s]+)([ \t]*(?:#[ \t]*([^\r\n]*))?)?(?=\r?$)', re.MULTILINE)
+SHA_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+
+# Every reference site contains this, so files without it are skipped undecoded
+USES_MARKER = b'uses:'
+
+
+class Site(NamedTuple):
+    """One action reference in a workflow file, its span in the content, and the key that resolves it."""
+    text: str
+    start: int
+    end: int
+    prefix: str
+    full_action: str
+    version: str
+    comment_part: Optional[str]
+    comment_text: Optional[str]
+    key: Key
+
+
+class FilePlan(NamedTuple):
+    """The content of a workflow file and the reference sites to rewrite in it."""
+    path: str
+    content: str
+    sites: List[Site]
+
+
+class Plan(NamedTuple):
+    """The reference sites of every workflow file in a run."""
+    files: List[FilePlan]
+
+    @property
+    def keys(self) -> List[Key]:
+        """The unique resolution keys of all sites, in the order they first appear."""
+        return list(OrderedDict.fromkeys(site.key for file_plan in self.files for site in file_plan.sites))
+
+
+def scan(file_path: str, content: str, convert_main_to_release: bool = False, update_to_latest: bool = False) -> FilePlan:
+    """Find the reference sites of a workflow file that the run should rewrite."""
+    sites = []
+    for match in ACTION_PATTERN.finditer(content):
+        prefix, full_action, version, comment_part, comment_text = match.groups()
+        # SHA references are only touched when updating to latest
+        if not update_to_latest and SHA_PATTERN.match(version):
+            continue
+        # Parse the action to separate base repository from variant
+        base_repo, full_action = parse_action_repo(full_action)
+        key = resolution_key(base_repo, version, convert_main_to_release, update_to_latest)
+        sites.append(Site(match.group(0), match.start(), match.end(), prefix, full_action, version,
+                          comment_part, comment_text, key))
+    return FilePlan(file_path, content, sites)
+
+
+def may_contain_references(file_path: str) -> bool:
+    """Check the memory-mapped bytes of a file for USES_MARKER, without decoding it."""
+    with open(file_path, 'rb') as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return data.find(USES_MARKER) != -1
+        except ValueError:
+            # Empty files cannot be mapped, and hold no references
+            return False
+        except OSError:
+            # Not mappable (a pipe, say); let the full scan decide
+            return True
+
+
+def plan(file_paths: List[str], convert_main_to_release: bool = False, update_to_latest: bool = False) -> Plan:
+    """
+    Read and scan every workflow file of a run. Files that cannot contain a
+    reference are planned with no content and no sites, and counted in the
+    'prefilter_rejected' statistic.
+    """
+    files = []
+    for file_path in file_paths:
+        if not may_contain_references(file_path):
+            stats.incr('prefilter_rejected')
+            files.append(FilePlan(file_path, '', []))
+            continue
+        with open(file_path, 'r') as f:
+            content = f.read()
+        files.append(scan(file_path, content, convert_main_to_release, update_to_latest))
+    return Plan(files)
+
+
+def rewrite(file_plan: FilePlan, resolve: Callable[[Key], Resolution],
+            unresolved: Optional[List[Site]] = None) -> Tuple[str, int, int]:
+    """
+    Rewrite the reference sites of a planned file with their resolutions.
+    Sites that could not be resolved are appended to unresolved, if given.
+    Returns a tuple of (new_content, changes_made, errors).
+
+    The new content is spliced together in one pass from the unchanged slices
+    between sites and the rewritten sites, so every site is replaced exactly
+    once and counted once, in time linear in the size of the file.
+    """
+    changes_made = 0
+    errors = 0
+    content = file_plan.content
+    parts = []
+    position = 0
+
+    for site in file_plan.sites:
+        sha, resolved_ref = resolve(site.key)
+        if not sha:
+            errors += 1
+            if unresolved is not None:
+                unresolved.append(site)
+            continue
+
+        version = site.version
+        if site.key[2] == MODE_LATEST:
+            # Check if we actually need to update
+            if SHA_PATTERN.match(version):
+                if site.comment_text and site.comment_text.strip() == resolved_ref:
+                    # Already at latest release
+                    continue
+            elif version == resolved_ref:
+                # Already at latest release
+                continue
+
+            print(f"Action: {site.full_action}@{version} → {site.full_action}@{sha}  # {resolved_ref}")
+            new_line = f"{site.prefix}{site.full_action}@{sha}  # {resolved_ref}"
+        else:
+            # Debug output
+            print(f"Action: {site.full_action}@{version} → SHA with tag: {resolved_ref}")
+
+            # Create the replacement with simplified comment format - always use resolved_ref
+            if site.comment_part and site.comment_part.strip():
+                new_line = f"{site.prefix}{site.full_action}@{sha}{site.comment_part}"
+            else:
+                new_line = f"{site.prefix}{site.full_action}@{sha}  # {resolved_ref}"
+
+        # Replace this specific occurrence
+        parts.append(content[position:site.start])
+        parts.append(new_line)
+        position = site.end
+        changes_made += 1
+
+    if not parts:
+        return content, changes_made, errors
+    parts.append(content[position:])
+    return ''.join(parts), changes_made, errors
+
+
+def write(file_path: str, content: str) -> None:
+    """Write the rewritten content of a workflow file."""
+    with open(file_path, 'w') as f:
+        f.write(content)
@@ -0,0 +1,235 @@
+"""
+Caching proxy for the part of the GitHub REST API that tag2sha uses, shared by many runners.
+
+Clients point their API base URL at the proxy (tag2sha --api-url http://HOST:PORT).
+It answers GETs of:
+
+    /repos/{owner}/{repo}/releases/latest
+    /repos/{owner}/{repo}/tags
+    /repos/{owner}/{repo}/git/refs/{ref}
+    /repos/{owner}/{repo}/git/matching-refs/{ref}
+    /repos/{owner}/{repo}/git/tags/{sha}
+    /repos/{owner}/{repo}/commits/{ref}
+
+from a shared fact cache, fetching upstream with the proxy's own token. Its
+counters and the upstream rate-limit budget are served at /proxy/status.
+"""
+import hmac
+import re
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from tag2sha import stats
+from tag2sha.cache import get_fact_cache
+from tag2sha.github import DeadlineExceeded, api_get
+from tag2sha.ratelimit import RateLimitExhausted, RateLimitScheduler
+from tag2sha.server import JSONHandler, serve_until_interrupted
+
+DEFAULT_PORT = 8780
+
+# Seconds a cached response is served before it is revalidated upstream
+DEFAULT_MAX_AGE = 60
+
+# Write the fact cache out at most this often while serving
+FLUSH_INTERVAL = 30
+
+PROXIED_PATH = re.compile(r'^/repos/[^/]+/[^/]+/(releases/latest|tags|git/(refs|matching-refs)/[^/]+(/[^/]+)*|'
+                          r'git/tags/[0-9a-f]{40}|commits/[^/]+)$')
+
+# Encoded dots, slashes and backslashes could turn into path segments upstream
+ENCODED_SEPARATOR = re.compile(r'%(2e|2f|5c)', re.IGNORECASE)
+
+# Upstream answers worth caching; anything else is passed through as is
+CACHED_STATUSES = (200, 404)
+
+
+def is_proxied(path: str) -> bool:
+    """
+    Check that path is one the proxy serves and stays that path upstream: the
+    HTTP client removes dot segments, so '/repos/a/b/git/refs/../../../../../user'
+    would otherwise reach '/user' with the proxy's token.
+    """
+    if '\\' in path or ENCODED_SEPARATOR.search(path):
+        return False
+    if any(not segment.strip('.') for segment in path.split('/')[1:]):
+        # Empty, '.', '..' and other dot-only segments
+        return False
+    return PROXIED_PATH.match(path) is not None
+
+
+class _Handler(JSONHandler):
+    def do_GET(self):
+        proxy = self.server.proxy
+        if proxy.client_token and not hmac.compare_digest(self.headers.get('Authorization', ''),
+                                                          f'token {proxy.client_token}'):
+            return self._send_json(401, {'message': 'Requires the token of this tag2sha proxy'})
+        if self.path == '/proxy/status':
+            return self._send_json(200, proxy.status())
+        if not is_proxied(urlsplit(self.path).path):
+            return self._send_json(404, {'message': f'tag2sha proxy does not serve {self.path}'})
+
+        accept = self.headers.get('Accept', '')
+        # Only GitHub media types change the response; '*/*' and the like share one entry
+        accept = accept if accept.startswith('application/vnd.github') else None
+        try:
+            entry, state = proxy.get(self.path, accept)
+        except RateLimitExhausted as e:
+            return self._send_json(403, {'message': f'API rate limit exceeded: {e}'}, {
+                'X-RateLimit-Limit': str(e.limit or 0),
+                'X-RateLimit-Remaining': '0',
+                'X-RateLimit-Reset': str(int(e.reset)),
+            })
+        except (requests.RequestException, DeadlineExceeded) as e:
+            return self._send_json(502, {'message': f'Upstream request failed: {e}'})
+
+        headers = {'X-Tag2sha-Cache': state}
+        if entry.get('content_type'):
+            headers['Content-Type'] = entry['content_type']
+        if entry.get('etag'):
+            headers['ETag'] = entry['etag']
+            if entry['status'] == 200 and self.headers.get('If-None-Match') == entry['etag']:
+                stats.incr('proxy_not_modified')
+                return self._send(304, b'', headers)
+        if entry.get('link'):
+            headers['Link'] = entry['link'].replace(proxy.upstream, f"http://{self.headers.get('Host', '')}")
+        self._send(entry['status'], entry['body'].encode('utf-8'), headers)
+
+
+class Proxy:
+    """
+    Caching server for the GitHub API requests of tag2sha.
+
+    A cached response is served as is for max_age seconds, then revalidated
+    upstream with its ETag; 304 answers do not count against the rate limit.
+    Concurrent requests for the same response share one upstream request.
+    Once the scheduler's budget is down to its reserve, expired responses are
+    served stale rather than spending the rest of the budget.
+
+    Every response is fetched with the proxy's token, whatever the client
+    sent, so anyone who can connect can read what that token can read. With
+    client_token, only requests carrying 'Authorization: token <client_token>'
+    are served.
+    """
+
+    def __init__(self, token: str = None, upstream: str = '', scheduler: Optional[RateLimitScheduler] = None,
+                 max_age: float = DEFAULT_MAX_AGE, client_token: Optional[str] = None):
+        self.token = token
+        self.client_token = client_token
+        self.upstream = upstream.rstrip('/')
+        self.scheduler = scheduler
+        self.max_age = max_age
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, threading.Event] = {}
+        self._flushed = time.time()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'uptime': round(time.time() - self.started, 1),
+            'requests': stats.get('proxy_requests'),
+            'hits': stats.get('proxy_hits'),
+            'coalesced': stats.get('proxy_coalesced'),
+            'revalidated': stats.get('proxy_revalidated'),
+            'stale': stats.get('proxy_stale'),
+            'upstream_requests': stats.get('requests'),
+            'rate_limit': self.scheduler.budget('core') if self.scheduler is not None else None,
+        }
+
+    def get(self, path: str, accept: Optional[str] = None) -> Tuple[Dict[str, Any], str]:
+        """
+        Return the cached response for path and how it was obtained: 'hit',
+        'coalesced', 'revalidated', 'stale' or 'miss'.
+        Raises RateLimitExhausted if the budget is spent and nothing is cached.
+        """
+        stats.incr('proxy_requests')
+        key = f'{accept or ""} {path}'
+        entry = get_fact_cache().get('proxy', '', key)
+        if entry is not None and time.time() - entry['fetched'] < self.max_age:
+            stats.incr('proxy_hits')
+            return entry, 'hit'
+
+        with self._lock:
+            event = self._pending.get(key)
+            owner = event is None
+            if owner:
+                event = self._pending[key] = threading.Event()
+        if not owner:
+            event.wait()
+            fresh = get_fact_cache().get('proxy', '', key)
+            if fresh is not None and (entry is None or fresh['fetched'] != entry['fetched']):
+                stats.incr('proxy_coalesced')
+                return fresh, 'coalesced'
+            # The upstream request failed or was not cacheable; make our own
+
+        try:
+            return self._fetch(path, accept, key, entry)
+        finally:
+            if owner:
+                with self._lock:
+                    del self._pending[key]
+                event.set()
+            self._flush()
+
+    def _fetch(self, path: str, accept: Optional[str], key: str,
+               stale: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], str]:
+        headers = {}
+        if accept:
+            headers['Accept'] = accept
+        if stale is not None and stale.get('etag'):
+            headers['If-None-Match'] = stale['etag']
+        try:
+            response = api_get(path, self.token, headers)
+        except (RateLimitExhausted, requests.RequestException, DeadlineExceeded):
+            if stale is None:
+                raise
+            stats.incr('proxy_stale')
+            return stale, 'stale'
+
+        if response.status_code == 304 and stale is not None:
+            stats.incr('proxy_revalidated')
+            entry, state = dict(stale, fetched=time.time()), 'revalidated'
+        else:
+            entry, state = {
+                'status': response.status_code,
+                'content_type': response.headers.get('Content-Type'),
+                'etag': response.headers.get('ETag'),
+                'link': response.headers.get('Link'),
+                'body': response.text,
+                'fetched': time.time(),
+            }, 'miss'
+            if response.status_code not in CACHED_STATUSES:
+                if stale is not None and response.status_code >= 500:
+                    stats.incr('proxy_stale')
+                    return stale, 'stale'
+                return entry, state
+        get_fact_cache().set('proxy', '', key, entry)
+        return entry, state
+
+    def _flush(self) -> None:
+        with self._lock:
+            if time.time() - self._flushed < FLUSH_INTERVAL:
+                return
+            self._flushed = time.time()
+        get_fact_cache().close()
+
+    def serve(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT) -> None:
+        """Serve on host:port until interrupted."""
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.proxy = self
+        print(f"tag2sha proxy for {self.upstream} listening on "
+              f"http://{host}:{server.server_address[1]}", file=sys.stderr)
+        try:
+            serve_until_interrupted(server)
+        finally:
+            server.server_close()
+            get_fact_cache().close()
+            status = self.status()
+            print(f"Served {status['requests']} requests: {status['hits']} from cache, "
+                  f"{status['coalesced']} coalesced, {status['revalidated']} revalidated, "
+                  f"{status['stale']} stale; {status['upstream_requests']} upstream requests", file=sys.stderr)
@@ -0,0 +1,170 @@
+"""Scheduling of GitHub API requests within the primary and secondary rate limits."""
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional
+
+import requests
+
+from tag2sha import stats
+
+# Start spreading requests evenly over the time left until the reset once
+# less than this fraction of the primary budget remains
+PACE_BELOW_FRACTION = 0.1
+
+# Secondary rate limits without a Retry-After header: wait this long, doubling
+# on every further hit
+SECONDARY_BACKOFF = 60.0
+
+# Give up and hand a rate-limited response to the caller after this many retries
+MAX_RATE_LIMIT_RETRIES = 3
+
+
+class RateLimitExhausted(Exception):
+    """The primary rate limit is used up and waiting for the reset was not allowed."""
+
+    def __init__(self, resource: str, limit: Optional[int], reset: float):
+        self.resource = resource
+        self.limit = limit
+        self.reset = reset
+        reset_at = datetime.fromtimestamp(reset).strftime('%H:%M:%S')
+        super().__init__(f"GitHub API rate limit for '{resource}' exhausted "
+                         f"(limit: {limit if limit is not None else '?'} requests), resets at {reset_at}")
+
+
+class RateLimitScheduler:
+    """
+    Tracks the primary rate-limit budget of each API resource from the
+    X-RateLimit-* response headers and schedules requests to fit it.
+
+    The remaining budget is the one the latest response reported, less the
+    requests still in flight, so requests GitHub does not charge for (such as
+    304 answers) cost nothing. Once it runs low, requests are paced evenly until the
+    reset. When the budget is spent, acquire() either sleeps until the reset or
+    raises RateLimitExhausted. Secondary rate limits are retried after
+    Retry-After or an exponential backoff.
+    """
+
+    def __init__(self, wait_on_exhausted: bool = False, reserve: int = 0):
+        self.wait_on_exhausted = wait_on_exhausted
+        self.reserve = reserve
+        self._lock = threading.Lock()
+        self._budgets: Dict[str, Dict[str, float]] = {}
+        self._in_flight: Dict[str, int] = Counter()
+        self._next_slot: Dict[str, float] = {}
+
+    def acquire(self, resource: str) -> None:
+        """
+        Block until a request against resource fits the budget. Every acquire()
+        must be followed by update() with the response, or release() if the
+        request failed without one.
+        """
+        with self._lock:
+            budget = self._budgets.get(resource)
+            now = time.time()
+            if budget is None or now >= budget['reset']:
+                self._in_flight[resource] += 1
+                return
+            remaining = budget['remaining'] - self._in_flight[resource]
+            if remaining <= self.reserve:
+                if not self.wait_on_exhausted:
+                    raise RateLimitExhausted(resource, budget.get('limit'), budget['reset'])
+                wait = budget['reset'] - now + 1
+                delay = None
+            else:
+                self._in_flight[resource] += 1
+                delay = self._pace(resource, budget, remaining, now)
+
+        if delay is None:
+            self._sleep(wait, f"Rate limit for '{resource}' exhausted, waiting {int(wait)}s for the reset")
+            # The first request after the reset reports the new budget
+            with self._lock:
+                self._budgets.pop(resource, None)
+                self._in_flight[resource] += 1
+        elif delay > 0:
+            stats.incr('rate_limit_paced')
+            time.sleep(delay)
+
+    def release(self, resource: str) -> None:
+        """Account for an acquired request that ended without a response."""
+        with self._lock:
+            self._in_flight[resource] = max(self._in_flight[resource] - 1, 0)
+
+    def budget(self, resource: str) -> Optional[Dict[str, float]]:
+        """
+        Return the last reported limit, remaining requests and reset time of
+        resource, and the requests in flight against it, if known.
+        """
+        with self._lock:
+            budget = self._budgets.get(resource)
+            if budget is None:
+                return None
+            return dict(budget, in_flight=self._in_flight[resource])
+
+    def _pace(self, resource: str, budget: Dict[str, float], remaining: float, now: float) -> float:
+        """Return how long to wait so the remaining budget lasts until the reset."""
+        limit = budget.get('limit') or 0
+        if remaining >= limit * PACE_BELOW_FRACTION:
+            return 0.0
+        interval = (budget['reset'] - now) / max(remaining - self.reserve, 1)
+        slot = max(now, self._next_slot.get(resource, now))
+        self._next_slot[resource] = slot + interval
+        return slot - now
+
+    def update(self, resource: str, response: requests.Response, attempt: int) -> Optional[float]:
+        """
+        Record the budget reported by a response.
+
+        Returns the number of seconds to wait before retrying the request, or
+        None if the response should be returned to the caller.
+        """
+        self.release(resource)
+        headers = response.headers
+        if 'X-RateLimit-Remaining' in headers and 'X-RateLimit-Reset' in headers:
+            resource = headers.get('X-RateLimit-Resource', resource)
+            remaining = int(headers['X-RateLimit-Remaining'])
+            reset = float(headers['X-RateLimit-Reset'])
+            with self._lock:
+                budget = self._budgets.get(resource)
+                # Within a window the reported budget never grows, so a higher
+                # value is from a concurrent response that arrived out of order
+                if budget is not None and budget['reset'] == reset:
+                    remaining = min(remaining, budget['remaining'])
+                self._budgets[resource] = {
+                    'limit': int(headers.get('X-RateLimit-Limit', 0)) or None,
+                    'remaining': remaining,
+                    'reset': reset,
+                }
+
+        if response.status_code not in (403, 429) or attempt >= MAX_RATE_LIMIT_RETRIES:
+            return None
+
+        retry_after = headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            stats.incr('secondary_rate_limits')
+            self._note(f"Secondary rate limit hit, retrying in {retry_after}s")
+            return float(retry_after)
+
+        if headers.get('X-RateLimit-Remaining') == '0':
+            # Primary budget spent: acquire() waits for the reset or raises
+            return 0.0
+
+        if 'secondary rate limit' in response.text.lower():
+            stats.incr('secondary_rate_limits')
+            delay = SECONDARY_BACKOFF * 2 ** attempt
+            self._note(f"Secondary rate limit hit, backing off for {int(delay)}s")
+            return delay
+
+        return None
+
+    def _sleep(self, seconds: float, message: str) -> None:
+        stats.incr('rate_limit_waits')
+        self._note(message)
+        time.sleep(max(seconds, 0))
+
+    @staticmethod
+    def _note(message: str) -> None:
+        # Bypass output capture so waits are reported when they happen
+        print(message, file=sys.__stderr__)
@@ -0,0 +1,125 @@
+"""Helpers for classifying references and picking tags from a tag listing."""
+import fnmatch
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import semver
+
+# Resolution modes, part of every resolution key
+MODE_PIN = 'pin'
+MODE_RELEASE = 'release'
+MODE_LATEST = 'latest'
+
+# A resolution key is (base_repo, ref, mode), with ref None for MODE_LATEST,
+# and it resolves to (sha, resolved_ref); sha is None if it could not be resolved
+Key = Tuple[str, Optional[str], str]
+Resolution = Tuple[Optional[str], Optional[str]]
+
+
+def group_by_repo(keys: Iterable[Key]) -> Dict[str, List[Key]]:
+    """Group (base_repo, ref, mode) resolution keys by repository, in the order repositories first appear."""
+    by_repo = OrderedDict()
+    for key in keys:
+        by_repo.setdefault(key[0], []).append(key)
+    return by_repo
+
+
+def is_version_pattern(ref: str) -> bool:
+    """Return True for major-version references like 'v4' that track the latest matching tag."""
+    return ref.startswith('v') and len(ref) > 1 and ref[1:].isdigit()
+
+
+def parse_version(tag_name: str) -> Optional[semver.VersionInfo]:
+    """Parse a tag name like 'v1.2.3' as a semantic version, or return None."""
+    clean_tag = tag_name[1:] if tag_name.startswith('v') else tag_name
+    try:
+        return semver.VersionInfo.parse(clean_tag)
+    except ValueError:
+        return None
+
+
+def tag_matches(tag_name: str, version_pattern: str) -> bool:
+    """Return True if tag_name matches a version pattern; 'v4' matches 'v4*'."""
+    # For example, if version_pattern is 'v4', we want to match 'v4*'
+    if is_version_pattern(version_pattern):
+        return fnmatch.fnmatch(tag_name, f"{version_pattern}*")
+    return fnmatch.fnmatch(tag_name, version_pattern)
+
+
+def select_latest_tag(tag_names: List[str]) -> Optional[str]:
+    """
+    Pick the highest semantic version from a list of tag names.
+    Falls back to the first tag if none of them is a semantic version.
+    """
+    if not tag_names:
+        return None
+
+    # Try to find and sort semantic versions
+    versioned_tags = []
+    for tag_name in tag_names:
+        # Skip tags that don't look like versions (no v prefix, no digits)
+        if not (tag_name.startswith('v') or any(c.isdigit() for c in tag_name)):
+            continue
+
+        # Clean tag for semver parsing
+        clean_tag = tag_name
+        if tag_name.startswith('v'):
+            clean_tag = tag_name[1:]
+
+        try:
+            semver.parse(clean_tag)
+            versioned_tags.append((tag_name, clean_tag))
+        except ValueError:
+            # Skip tags that aren't valid semver
+            continue
+
+    if versioned_tags:
+        # Sort by semantic version
+        sorted_tags = sorted(
+            versioned_tags,
+            key=lambda x: semver.VersionInfo.parse(x[1]),
+            reverse=True
+        )
+        return sorted_tags[0][0]  # Return the highest version tag
+
+    # If no semantic versions found, just return the first tag
+    return tag_names[0]
+
+
+def select_matching_tag(tag_names: List[str], version_pattern: str) -> Optional[str]:
+    """Pick the latest tag from a list of tag names that matches the given pattern."""
+    # Find all matching tags
+    matching_tags = [tag_name for tag_name in tag_names if tag_matches(tag_name, version_pattern)]
+
+    if not matching_tags:
+        return None
+
+    # Sort tags by semantic versioning if possible
+    try:
+        # Clean tags to valid semver if needed
+        clean_tags = []
+        for tag in matching_tags:
+            # Handle tags like 'v1.2.3'
+            tag_version = tag
+            if tag.startswith('v'):
+                tag_version = tag[1:]
+
+            # Try to parse as semver, add if valid
+            try:
+                semver.parse(tag_version)
+                clean_tags.append((tag, tag_version))
+            except ValueError:
+                # If not valid semver, still keep the original tag
+                clean_tags.append((tag, None))
+
+        # Sort by semantic version, putting non-semver tags at the end
+        sorted_tags = sorted(
+            clean_tags,
+            key=lambda x: semver.VersionInfo.parse(x[1]) if x[1] is not None else semver.VersionInfo(0, 0, 0),
+            reverse=True
+        )
+        return sorted_tags[0][0]  # Return the original tag name
+    except (ValueError, ImportError):
+        # Fallback to simple string sorting if semver parsing fails
+        matching_tags.sort(reverse=True)
+        return matching_tags[0]
@@ -0,0 +1,325 @@
+"""Resolve action references to commit SHAs through the GitHub REST API."""
+import re
+import sys
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+from tag2sha import stats
+from tag2sha.cache import get_fact_cache
+from tag2sha.github import NetworkDisabled, api_get
+from tag2sha.refs import MODE_LATEST, MODE_PIN, MODE_RELEASE, is_version_pattern, parse_version, select_latest_tag, select_matching_tag, tag_matches
+
+TAGS_PER_PAGE = 100
+
+# Makes the commits endpoint answer with just the commit SHA as plain text
+COMMIT_SHA_MEDIA_TYPE = 'application/vnd.github.sha'
+COMMIT_SHA_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+
+class TagListingError(Exception):
+    """A page of the tag listing could not be fetched."""
+    
+    def __init__(self, response: requests.Response):
+        super().__init__(f"{response.status_code} - {response.text}")
+        self.response = response
+
+def iter_tag_pages(repo: str, token: str = None) -> Iterator[List[Dict]]:
+    """
+    Lazily yield the pages of a repository's tag listing, TAGS_PER_PAGE tags per page.
+    Raises TagListingError if a page cannot be fetched.
+    """
+    page = 1
+    while True:
+        response = api_get(f'/repos/{repo}/tags?per_page={TAGS_PER_PAGE}&page={page}', token, conditional=True)
+        if response.status_code != 200:
+            raise TagListingError(response)
+        stats.incr('tag_pages')
+        yield response.json()
+        if 'next' not in response.links:
+            return
+        page += 1
+
+def list_tags(repo: str, token: str = None, is_candidate: Callable[[str], bool] = None) -> Optional[List[Dict]]:
+    """
+    Fetch the tag listing of a repository, stopping early when possible.
+    
+    GitHub lists tags newest version first, so once a page contains a
+    semantic-version tag accepted by is_candidate, no later page can hold a
+    higher one and the remaining pages are skipped. If the versions read so far
+    are not in descending order, every page is read instead.
+    Returns None if the tags could not be fetched.
+    """
+    tags = []
+    ordered = True
+    previous = None
+    try:
+        for page in iter_tag_pages(repo, token):
+            tags.extend(page)
+            found = False
+            for tag in page:
+                version = parse_version(tag['name'])
+                if version is None:
+                    continue
+                if previous is not None and version > previous:
+                    ordered = False
+                previous = version
+                if is_candidate is not None and is_candidate(tag['name']):
+                    found = True
+            if found and ordered:
+                break
+    except TagListingError as e:
+        print(f"Error: Could not fetch tags for {repo}", file=sys.stderr)
+        print(f"API response: {e}", file=sys.stderr)
+        return None
+    return tags
+
+def select_from_listing(tags: List[Dict], select: Callable[[List[str]], Optional[str]]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Pick a tag from a tag listing with select, and return it with the commit
+    SHA the listing already reports for it.
+    """
+    shas = {tag['name']: tag['commit']['sha'] for tag in tags}
+    selected = select(list(shas))
+    return selected, shas.get(selected)
+
+def cached_ref(kind: str, repo: str, ref: str, fetch: Callable[[], Tuple[Optional[str], Optional[str]]]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Get a (tag, sha) pair whose tag is cached as a kind fact; fetch is called on a miss.
+    The SHA is None if it was neither found along with the tag nor cached as a tag fact.
+    """
+    facts = get_fact_cache()
+    found = {}
+    
+    def fetch_tag() -> Optional[str]:
+        tag, sha = fetch()
+        if tag and sha:
+            facts.set('tag', repo, tag, sha)
+        found[tag] = sha
+        return tag
+    
+    tag = facts.fetch(kind, repo, ref, fetch_tag)
+    if tag is None:
+        return None, None
+    return tag, found.get(tag) or facts.get('tag', repo, tag)
+
+def get_latest_release(repo: str, token: str = None) -> Optional[str]:
+    """Get the latest release tag for a repository, using the fact cache."""
+    return get_latest_release_ref(repo, token)[0]
+
+def get_latest_release_ref(repo: str, token: str = None) -> Tuple[Optional[str], Optional[str]]:
+    """Get the latest release tag for a repository and its commit SHA if known, using the fact cache."""
+    return cached_ref('latest_release', repo, '', lambda: fetch_latest_release(repo, token))
+
+def fetch_latest_release(repo: str, token: str = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Get the latest release tag for a repository from the API.
+    Returns (tag, sha); the SHA is only known if the tag came from the tag listing.
+    """
+    # Try the releases API first (excludes pre-releases by default)
+    response = api_get(f'/repos/{repo}/releases/latest', token, conditional=True)
+    
+    if response.status_code == 200:
+        return response.json().get('tag_name'), None
+    
+    # If no official "latest" release, fall back to the highest version tag
+    tags = list_tags(repo, token, lambda name: parse_version(name) is not None)
+    if tags is None:
+        return None, None
+    
+    return select_from_listing(tags, select_latest_tag)
+
+def get_latest_matching_tag(repo: str, version_pattern: str, token: str = None) -> Optional[str]:
+    """Get the latest tag that matches the given pattern, using the fact cache."""
+    return get_latest_matching_ref(repo, version_pattern, token)[0]
+
+def get_latest_matching_ref(repo: str, version_pattern: str, token: str = None) -> Tuple[Optional[str], Optional[str]]:
+    """Get the latest tag that matches the given pattern and its commit SHA if known, using the fact cache."""
+    return cached_ref('matching_tag', repo, version_pattern,
+                      lambda: fetch_latest_matching_ref(repo, version_pattern, token))
+
+def fetch_latest_matching_ref(repo: str, version_pattern: str, token: str = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Get the latest tag that matches the given pattern and its commit SHA from the API.
+    
+    Only the tags under the pattern's prefix are requested, and the selected tag
+    is peeled in the same pass. Falls back to the tag listing if the matching
+    refs cannot be fetched.
+    """
+    response = api_get(f'/repos/{repo}/git/matching-refs/tags/{version_pattern}', token, conditional=True)
+    if response.status_code == 404:
+        # The repository does not exist; the listing would not find it either
+        return None, None
+    if response.status_code != 200:
+        return fetch_latest_matching_tag(repo, version_pattern, token)
+    
+    refs = {ref['ref'][len('refs/tags/'):]: ref['object'] for ref in response.json()}
+    latest_tag = select_matching_tag(list(refs), version_pattern)
+    if latest_tag is None:
+        return None, None
+    
+    target = refs[latest_tag]
+    if target.get('type') == 'tag':
+        # Annotated tag, peel it to the commit it points to
+        tag_sha = target['sha']
+        return latest_tag, get_fact_cache().fetch('peel', repo, tag_sha,
+                                                  lambda: peel_tag_object(repo, tag_sha, token))
+    return latest_tag, target['sha']
+
+def fetch_latest_matching_tag(repo: str, version_pattern: str, token: str = None) -> Tuple[Optional[str], Optional[str]]:
+    """Get the latest tag that matches the given pattern and its commit SHA from the tag listing."""
+    # Fetch tags down to the newest semantic version that matches
+    tags = list_tags(repo, token,
+                     lambda name: parse_version(name) is not None and tag_matches(name, version_pattern))
+    if tags is None:
+        return None, None
+    
+    return select_from_listing(tags, lambda names: select_matching_tag(names, version_pattern))
+
+def parse_action_repo(action: str) -> Tuple[str, str]:
+    """
+    Parse an action reference to separate repository and variant components.
+    
+    Args:
+        action: Full action reference like 'github/super-linter/slim' or 'actions/checkout'
+    
+    Returns:
+        Tuple of (base_repo, full_action) where:
+        - base_repo: Repository for API calls (e.g., 'github/super-linter')
+        - full_action: Full action path for workflow references (e.g., 'github/super-linter/slim')
+    """
+    parts = action.split('/')
+    if len(parts) > 2:
+        # Has variant like /slim - use only owner/repo for API calls
+        base_repo = f"{parts[0]}/{parts[1]}"
+        return base_repo, action
+    else:
+        # Standard owner/repo format
+        return action, action
+
+def peel_tag_object(repo: str, tag_sha: str, token: str = None) -> Optional[str]:
+    """Get the commit SHA an annotated tag object points to."""
+    response = api_get(f'/repos/{repo}/git/tags/{tag_sha}', token)
+    if response.status_code == 200:
+        return response.json()['object']['sha']
+    return None
+
+def get_commit_sha(repo: str, tag: str, token: str = None, convert_main_to_release: bool = False) -> Tuple[str, str]:
+    """
+    Get the commit SHA for a given tag/ref in a repository.
+    Returns a tuple of (sha, resolved_ref) where resolved_ref is the tag/ref that was actually used.
+    """
+    resolved_ref = tag
+    original_ref = tag  # Store the original reference
+    
+    # Handle main/master branch conversion if enabled
+    if convert_main_to_release and tag.lower() in ['main', 'master']:
+        latest_release, latest_sha = get_latest_release_ref(repo, token)
+        if latest_release:
+            print(f"Converting {repo}@{tag} to latest release: {latest_release}")
+            resolved_ref = latest_release
+            tag = latest_release
+            if latest_sha:
+                return latest_sha, resolved_ref
+        else:
+            print(f"Warning: No releases found for {repo}, keeping {tag} reference")
+    
+    # Check if this is a version reference (like 'v4') that should get the latest matching tag
+    elif is_version_pattern(tag):
+        # It's a version reference like 'v4', find the latest matching tag
+        latest_tag, latest_sha = get_latest_matching_ref(repo, tag, token)
+        if latest_tag and latest_tag != tag:
+            print(f"Resolving {repo}@{tag} to latest matching tag: {latest_tag}")
+            resolved_ref = latest_tag
+            tag = latest_tag
+        if latest_sha:
+            return latest_sha, resolved_ref
+    
+    facts = get_fact_cache()
+    sha = facts.get('tag', repo, tag) or facts.get('branch', repo, tag)
+    if sha:
+        return sha, resolved_ref
+    
+    responses = []
+    
+    def fetch_commit() -> Optional[str]:
+        # Fast path: the commits endpoint peels the ref and returns the bare SHA in
+        # one request. Like git, it prefers a tag over a branch of the same name.
+        response = api_get(f'/repos/{repo}/commits/{tag}', token, {'Accept': COMMIT_SHA_MEDIA_TYPE}, conditional=True)
+        responses.append(response)
+        commit_sha = response.text.strip() if response.status_code == 200 else ''
+        return commit_sha if COMMIT_SHA_PATTERN.match(commit_sha) else None
+    
+    # Tags selected above are known to be tags; any other name may be a branch
+    # that moves, so it is only cached as long as a branch head
+    sha = facts.fetch('tag' if tag != original_ref else 'branch', repo, tag, fetch_commit)
+    if sha:
+        return sha, resolved_ref
+    if responses and responses[0].status_code == 404:
+        # The repository does not exist or is not accessible
+        response = responses[0]
+        print(f"Error: Could not find SHA for {repo}@{tag}", file=sys.stderr)
+        print(f"API response: {response.status_code} - {response.text}", file=sys.stderr)
+        return None, resolved_ref
+    
+    # Fall back to looking the name up as a tag, then as a branch
+    def lookup(ref_kind: str) -> Optional[str]:
+        response = api_get(f'/repos/{repo}/git/refs/{ref_kind}/{tag}', token, conditional=True)
+        responses.append(response)
+        if response.status_code != 200:
+            return None
+        
+        ref_data = response.json()
+        if ref_data.get('object', {}).get('type') == 'tag':
+            # This is an annotated tag, need to get the commit it points to
+            tag_sha = ref_data['object']['sha']
+            return facts.fetch('peel', repo, tag_sha, lambda: peel_tag_object(repo, tag_sha, token))
+        # This is a direct reference to a commit
+        return ref_data['object']['sha']
+    
+    # Try the reference as a tag first, then as a branch
+    sha = (facts.fetch('tag', repo, tag, lambda: lookup('tags'))
+           or facts.fetch('branch', repo, tag, lambda: lookup('heads')))
+    if sha:
+        return sha, resolved_ref
+    
+    # If we can't find the ref or something else went wrong
+    print(f"Error: Could not find SHA for {repo}@{tag}", file=sys.stderr)
+    if responses:
+        response = responses[-1]
+        print(f"API response: {response.status_code} - {response.text}", file=sys.stderr)
+    return None, resolved_ref
+
+def resolution_key(base_repo: str, ref: str, convert_main_to_release: bool = False, update_to_latest: bool = False) -> Tuple[str, Optional[str], str]:
+    """
+    Build the (base_repo, ref, mode) key that identifies a resolution.
+    References that resolve identically share a key.
+    """
+    if update_to_latest:
+        return base_repo, None, MODE_LATEST
+    if convert_main_to_release and ref.lower() in ['main', 'master']:
+        return base_repo, ref, MODE_RELEASE
+    return base_repo, ref, MODE_PIN
+
+def resolve_reference(base_repo: str, ref: Optional[str], mode: str, token: str = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Resolve a reference according to mode.
+    Returns a tuple of (sha, resolved_ref); sha is None if resolution failed.
+    """
+    try:
+        if mode == MODE_LATEST:
+            latest_release, latest_sha = get_latest_release_ref(base_repo, token)
+            if not latest_release:
+                print(f"Warning: No release found for {base_repo}, skipping")
+                return None, None
+            if latest_sha:
+                return latest_sha, latest_release
+            return get_commit_sha(base_repo, latest_release, token, False)
+        
+        return get_commit_sha(base_repo, ref, token, mode == MODE_RELEASE)
+    except NetworkDisabled:
+        print(f"Skipped: {base_repo}@{ref or 'latest'} is not in the local cache", file=sys.stderr)
+        return None, ref
+    except requests.RequestException as e:
+        # Retries are exhausted; report this reference as an error and carry on
+        print(f"Error: Request failed while resolving {base_repo}@{ref or 'latest'}: {e}", file=sys.stderr)
+        return None, ref
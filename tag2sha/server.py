@@ -0,0 +1,39 @@
+"""HTTP plumbing shared by the resolution daemon and the caching proxy."""
+import json
+import signal
+from http.server import BaseHTTPRequestHandler
+from typing import Any, Dict, Optional
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    """Quiet HTTP/1.1 request handler with helpers for sending JSON responses."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, headers: Dict[str, str]) -> None:
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        self._send(status, json.dumps(body).encode(), dict(headers or {}, **{'Content-Type': 'application/json'}))
+
+
+def serve_until_interrupted(server) -> None:
+    """Serve requests until SIGINT or SIGTERM; closing the server is left to the caller."""
+    signal.signal(signal.SIGTERM, _interrupt)
+    signal.signal(signal.SIGINT, _interrupt)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
@@ -0,0 +1,31 @@
+"""Run-wide counters reported in the tag2sha summary."""
+import threading
+from collections import Counter
+from typing import Dict
+
+_lock = threading.Lock()
+_counters = Counter()
+
+
+def incr(name: str, amount: int = 1) -> None:
+    """Increment the named counter."""
+    with _lock:
+        _counters[name] += amount
+
+
+def get(name: str) -> int:
+    """Return the current value of the named counter."""
+    with _lock:
+        return _counters[name]
+
+
+def snapshot() -> Dict[str, int]:
+    """Return a copy of all counters."""
+    with _lock:
+        return dict(_counters)
+
+
+def reset() -> None:
+    """Clear all counters."""
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,76 @@
+"""Pool of GitHub tokens whose rate-limit budgets are spent in turn."""
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Iterable, List, Tuple
+
+from tag2sha.ratelimit import RateLimitScheduler
+
+
+def read_token_file(path: str) -> List[str]:
+    """Read one token per line, skipping blank lines and '#' comments."""
+    with open(path, 'r') as f:
+        lines = (line.strip() for line in f)
+        return [line for line in lines if line and not line.startswith('#')]
+
+
+class TokenPool:
+    """
+    Several GitHub tokens, each with its own RateLimitScheduler tracking its
+    budget from the X-RateLimit-* headers of the responses it was used for.
+
+    Every request goes out with the token that has the most budget left.
+    Tokens down to their reserve are skipped until their reset; once all of
+    them are, the token that resets first is used, and its scheduler waits for
+    the reset or raises RateLimitExhausted.
+    """
+
+    def __init__(self, tokens: Iterable[str], wait_on_exhausted: bool = False, reserve: int = 0):
+        self.tokens = list(OrderedDict.fromkeys(tokens))
+        if not self.tokens:
+            raise ValueError("A token pool needs at least one token")
+        self.reserve = reserve
+        self.schedulers = {token: RateLimitScheduler(wait_on_exhausted, reserve) for token in self.tokens}
+        self._lock = threading.Lock()
+        self._used = Counter()
+
+    def _left(self, token: str, resource: str, now: float) -> float:
+        budget = self.schedulers[token].budget(resource)
+        if budget is None or now >= budget['reset']:
+            # Not used yet, or reset since: assume the full budget
+            return float('inf')
+        return budget['remaining'] - budget['in_flight'] - self.reserve
+
+    def _reset(self, token: str, resource: str) -> float:
+        budget = self.schedulers[token].budget(resource)
+        # A concurrent acquire() drops the budget once it has waited for the reset
+        return budget['reset'] if budget is not None else 0.0
+
+    def select(self, resource: str) -> Tuple[str, RateLimitScheduler]:
+        """Pick the token for the next request against resource, and the scheduler to acquire it from."""
+        now = time.time()
+        with self._lock:
+            available = [token for token in self.tokens if self._left(token, resource, now) > 0]
+            if available:
+                token = max(available, key=lambda token: self._left(token, resource, now))
+            else:
+                token = min(self.tokens, key=lambda token: self._reset(token, resource))
+        return token, self.schedulers[token]
+
+    def record(self, token: str) -> None:
+        """Count a request sent with token."""
+        with self._lock:
+            self._used[token] += 1
+
+    def summary(self, resource: str = 'core') -> List[str]:
+        """Describe the requests made with each token and the budget it has left."""
+        lines = []
+        for number, token in enumerate(self.tokens, 1):
+            line = f"token {number} (...{token[-4:]}): {self._used[token]} requests"
+            budget = self.schedulers[token].budget(resource)
+            if budget is not None:
+                line += f", {int(budget['remaining'])}/{budget['limit'] or '?'} left"
+                if budget['remaining'] <= self.reserve:
+                    line += f" until {time.strftime('%H:%M:%S', time.localtime(budget['reset']))}"
+            lines.append(line)
+        return lines
@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+
+from tag2sha.cache import DiskCache
+
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'facts.json')
+
+    def test_reads_do_not_rewrite_the_file(self):
+        cache = DiskCache(self.path)
+        cache.set('commit', 'owner/action', 'a' * 40, True)
+        cache.close()
+        os.utime(self.path, (0, 0))
+
+        cache = DiskCache(self.path)
+        self.assertTrue(cache.get('commit', 'owner/action', 'a' * 40))
+        cache.close()
+        self.assertEqual(os.stat(self.path).st_mtime, 0)
+
+    def test_expired_and_evicted_facts_are_written_out(self):
+        cache = DiskCache(self.path)
+        cache.set('branch', 'owner/action', 'main', 'b' * 40)
+        cache.set('commit', 'owner/action', 'a' * 40, True)
+        cache.set('commit', 'owner/action', 'c' * 40, True)
+        cache.close()
+
+        cache = DiskCache(self.path, ttls={'branch': -1}, max_entries=1)
+        cache.get('commit', 'owner/action', 'a' * 40)
+        cache.close()
+
+        cache = DiskCache(self.path)
+        self.assertIsNone(cache.get('branch', 'owner/action', 'main'))
+        self.assertIsNone(cache.get('commit', 'owner/action', 'c' * 40))
+        self.assertTrue(cache.get('commit', 'owner/action', 'a' * 40))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+from unittest import mock
+
+from tag2sha import aio, daemon, engine
+from tag2sha.daemon import Daemon, DaemonClient
+from tag2sha.refs import MODE_LATEST, MODE_PIN
+
+SHA = 'a' * 40
+KEY = ('actions/checkout', 'v4', MODE_PIN)
+
+
+class DaemonResolveTest(unittest.TestCase):
+    """Daemon.resolve against a fake resolve_reference."""
+
+    def setUp(self):
+        self.calls = []
+        patcher = mock.patch.object(aio, 'resolve_reference', self.resolve_reference)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(daemon, 'get_fact_cache')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        capturing = engine.capturing_output()
+        capturing.__enter__()
+        self.addCleanup(capturing.__exit__, None, None, None)
+
+    def resolve_reference(self, repo, ref, mode, token=None):
+        self.calls.append((repo, ref, mode, token))
+        if repo == 'unknown/action':
+            return None, ref
+        print(f"Resolving {repo}@{ref} to latest matching tag: v4.2.2")
+        return SHA, 'v4.2.2'
+
+    def test_remembers_resolutions_between_requests(self):
+        server = Daemon('daemon-token')
+        first = server.resolve([KEY, KEY])
+        second = server.resolve([KEY])
+        self.assertEqual(self.calls, [KEY + ('daemon-token',)])
+        self.assertEqual(first[0][0], (SHA, 'v4.2.2'))
+        # The messages of a remembered resolution are sent again
+        self.assertEqual(second, first[:1])
+        self.assertEqual(server.status()['requests'], 2)
+
+    def test_remembers_resolutions_per_token(self):
+        server = Daemon('daemon-token')
+        server.resolve([KEY], 'one')
+        server.resolve([KEY], 'two')
+        server.resolve([KEY], 'one')
+        self.assertEqual([call[3] for call in self.calls], ['one', 'two'])
+
+    def test_failures_and_expired_resolutions_are_resolved_again(self):
+        server = Daemon(ttls={'branch': 0, 'matching_tag': 0})
+        server.resolve([KEY, ('unknown/action', 'v1', MODE_PIN)])
+        server.resolve([KEY, ('unknown/action', 'v1', MODE_PIN)])
+        self.assertEqual(len(self.calls), 4)
+
+    def test_ttl_follows_the_shortest_lived_fact(self):
+        server = Daemon(ttls={'branch': 300, 'matching_tag': 3600, 'latest_release': 600})
+        self.assertEqual(server._ttl(KEY), 300)
+        self.assertEqual(server._ttl(('actions/checkout', 'v4.2.2', MODE_PIN)), 300)
+        self.assertEqual(server._ttl(('actions/checkout', None, MODE_LATEST)), 600)
+
+
+class DaemonClientTokenTest(unittest.TestCase):
+    def serve(self, client_token):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), daemon._Handler)
+        server.daemon = Daemon(client_token=client_token)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+
+    def test_requires_the_client_token(self):
+        address = self.serve('secret')
+        self.assertIsNone(DaemonClient(address).status())
+        self.assertIsNone(DaemonClient(address, 'wrong').status())
+        self.assertIsNotNone(DaemonClient(address, 'secret').status())
+        self.assertIsNone(DaemonClient(address).resolve([]))
+
+    def test_port_needs_a_client_token(self):
+        with self.assertRaisesRegex(RuntimeError, 'client token'):
+            Daemon().serve(port=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
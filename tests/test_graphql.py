@@ -0,0 +1,41 @@
+import unittest
+from unittest import mock
+
+import requests
+
+from tag2sha import graphql
+from tag2sha.refs import MODE_PIN
+
+KEYS = [('owner/action', 'v1.0.0', MODE_PIN)]
+
+
+def _response(status: int, body: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response._content = body
+    return response
+
+
+class ResolveBatchTest(unittest.TestCase):
+    """A failed GraphQL query leaves its keys to the REST API instead of raising."""
+
+    def resolve(self, **api_post) -> dict:
+        with mock.patch.object(graphql, 'api_post', **api_post), mock.patch('sys.stderr'):
+            return graphql.resolve_batch(KEYS, 'token')
+
+    def test_connection_error(self):
+        self.assertEqual(self.resolve(side_effect=requests.ConnectionError('refused')), {})
+
+    def test_non_json_body(self):
+        self.assertEqual(self.resolve(return_value=_response(200, b'<html>')), {})
+
+    def test_error_status(self):
+        self.assertEqual(self.resolve(return_value=_response(502, b'Bad Gateway')), {})
+
+    def test_resolves_tags(self):
+        body = b'{"data": {"r0": {"t0": {"target": {"oid": "' + b'a' * 40 + b'"}}}}}'
+        self.assertEqual(self.resolve(return_value=_response(200, body)), {KEYS[0]: ('a' * 40, 'v1.0.0')})
+
+
+if __name__ == '__main__':
+    unittest.main()
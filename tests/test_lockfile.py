@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+import unittest
+
+from tag2sha.lockfile import Lockfile, LockfileError, lock_name
+from tag2sha.refs import MODE_LATEST, MODE_PIN, MODE_RELEASE
+
+SHA = 'a' * 40
+OTHER_SHA = 'b' * 40
+
+
+class LockfileTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'tag2sha.lock')
+
+    def test_round_trip(self):
+        lock = Lockfile(self.path)
+        lock.record(('actions/setup-python', 'v5', MODE_PIN), (OTHER_SHA, 'v5.1.0'))
+        lock.record(('actions/checkout', 'v4', MODE_PIN), (SHA, 'v4.2.2'))
+        lock.record(('actions/checkout', None, MODE_LATEST), (SHA, 'v4.2.2'))
+        self.assertTrue(lock.save())
+
+        lock = Lockfile(self.path)
+        self.assertEqual(len(lock), 3)
+        self.assertEqual(lock.get(('actions/checkout', 'v4', MODE_PIN)), (SHA, 'v4.2.2'))
+        self.assertEqual(lock.get(('actions/checkout', None, MODE_LATEST)), (SHA, 'v4.2.2'))
+        # Modes are locked separately
+        self.assertIsNone(lock.get(('actions/checkout', 'v4', MODE_RELEASE)))
+
+        with open(self.path) as f:
+            data = json.load(f)
+        self.assertEqual(list(data['references'][MODE_PIN]), ['actions/checkout@v4', 'actions/setup-python@v5'])
+        self.assertNotIn(MODE_RELEASE, data['references'])
+
+    def test_save_writes_only_changes(self):
+        lock = Lockfile(self.path)
+        self.assertFalse(lock.save())
+        self.assertFalse(os.path.exists(self.path))
+        lock.record(('actions/checkout', 'v4', MODE_PIN), (None, 'v4'))
+        self.assertFalse(lock.save())
+        lock.record(('actions/checkout', 'v4', MODE_PIN), (SHA, 'v4.2.2'))
+        self.assertTrue(lock.save())
+        self.assertFalse(lock.save())
+
+    def test_failed_resolutions_are_not_recorded(self):
+        lock = Lockfile(self.path)
+        lock.record(('actions/checkout', 'v4', MODE_PIN), (None, 'v4'))
+        self.assertEqual(len(lock), 0)
+
+    def test_max_age(self):
+        key = ('actions/checkout', 'v4', MODE_PIN)
+        with open(self.path, 'w') as f:
+            json.dump({'version': 1, 'references': {MODE_PIN: {lock_name(key): {
+                'tag': 'v4.2.2', 'sha': SHA, 'resolved_at': '2020-01-01T00:00:00+00:00'}}}}, f)
+        lock = Lockfile(self.path)
+        self.assertEqual(lock.get(key), (SHA, 'v4.2.2'))
+        self.assertIsNone(lock.get(key, max_age=60))
+        lock.record(key, (OTHER_SHA, 'v4.3.0'))
+        self.assertEqual(lock.get(key, max_age=60), (OTHER_SHA, 'v4.3.0'))
+
+    def test_unsupported_version(self):
+        with open(self.path, 'w') as f:
+            json.dump({'version': 99, 'references': {}}, f)
+        with self.assertRaisesRegex(LockfileError, 'Unsupported lockfile version'):
+            Lockfile(self.path)
+
+    def test_unreadable_file(self):
+        with open(self.path, 'w') as f:
+            f.write('{')
+        with self.assertRaisesRegex(LockfileError, 'Could not read lockfile'):
+            Lockfile(self.path)
+
+    def test_lock_name(self):
+        self.assertEqual(lock_name(('actions/checkout', 'v4', MODE_PIN)), 'actions/checkout@v4')
+        self.assertEqual(lock_name(('actions/checkout', None, MODE_LATEST)), 'actions/checkout')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from tag2sha.lsrefs import DELIM_PKT, FLUSH_PKT, ProtocolError, build_ls_refs_request, iter_pkt_lines, parse_ref_line, pkt_line, ref_prefixes
+from tag2sha.refs import MODE_LATEST, MODE_PIN
+
+TAG_OBJECT = '1' * 40
+COMMIT = '2' * 40
+HEAD = '3' * 40
+
+RESPONSE = (pkt_line(f'{TAG_OBJECT} refs/tags/v1.0.0 peeled:{COMMIT}\n')
+            + pkt_line(f'{COMMIT} refs/tags/v0.9.0\n')
+            + pkt_line(f'{HEAD} refs/heads/main\n')
+            + FLUSH_PKT)
+
+
+class PktLineTest(unittest.TestCase):
+    def test_pkt_line_framing(self):
+        self.assertEqual(pkt_line('a\n'), b'0006a\n')
+
+    def test_flush_delim_and_response_end(self):
+        self.assertEqual(list(iter_pkt_lines([b'0006a\n' + DELIM_PKT + b'0002' + FLUSH_PKT])),
+                         [b'a\n', None, None, None])
+
+    def test_lines_split_across_chunks(self):
+        chunks = [RESPONSE[i:i + 3] for i in range(0, len(RESPONSE), 3)]
+        self.assertEqual(list(iter_pkt_lines(chunks)), list(iter_pkt_lines([RESPONSE])))
+        self.assertEqual(len(list(iter_pkt_lines(chunks))), 4)
+
+    def test_err_packet(self):
+        with self.assertRaisesRegex(ProtocolError, 'access denied'):
+            list(iter_pkt_lines([pkt_line('ERR access denied\n')]))
+
+    def test_truncated_payload(self):
+        with self.assertRaisesRegex(ProtocolError, 'truncated'):
+            list(iter_pkt_lines([RESPONSE[:30]]))
+
+    def test_truncated_length(self):
+        with self.assertRaisesRegex(ProtocolError, 'truncated'):
+            list(iter_pkt_lines([b'00']))
+
+    def test_invalid_length(self):
+        with self.assertRaisesRegex(ProtocolError, 'invalid pkt-line length'):
+            list(iter_pkt_lines([b'<html>']))
+
+    def test_request(self):
+        request = build_ls_refs_request(['refs/tags/v1'])
+        lines = list(iter_pkt_lines([request]))
+        self.assertEqual(lines, [b'command=ls-refs\n', b'agent=tag2sha\n', None, b'peel\n',
+                                 b'ref-prefix refs/tags/v1\n', None])
+
+
+class RefLineTest(unittest.TestCase):
+    def test_parses_tags_peeled_tags_and_heads(self):
+        tags, heads = {}, {}
+        for line in iter_pkt_lines([RESPONSE]):
+            if line is not None:
+                parse_ref_line(line, tags, heads)
+        self.assertEqual(tags, {'v1.0.0': COMMIT, 'v0.9.0': COMMIT})
+        self.assertEqual(heads, {'main': HEAD})
+
+    def test_ignores_other_refs(self):
+        tags, heads = {}, {}
+        parse_ref_line(f'{HEAD} refs/pull/1/head\n'.encode(), tags, heads)
+        self.assertEqual((tags, heads), ({}, {}))
+
+    def test_ref_prefixes(self):
+        keys = [('o/a', 'v4', MODE_PIN), ('o/a', 'main', MODE_PIN), ('o/a', None, MODE_LATEST),
+                ('o/a', 'v4', MODE_PIN)]
+        self.assertEqual(ref_prefixes(keys), ['refs/tags/v4', 'refs/tags/main', 'refs/heads/main', 'refs/tags/'])
+
+
+if __name__ == '__main__':
+    unittest.main()
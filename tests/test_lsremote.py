@@ -0,0 +1,62 @@
+import os
+import subprocess
+import tempfile
+import unittest
+
+from tag2sha.lsremote import resolve_batch
+from tag2sha.refs import MODE_LATEST, MODE_PIN, MODE_RELEASE
+
+
+def git(*args, cwd=None):
+    env = dict(os.environ, GIT_AUTHOR_NAME='t', GIT_AUTHOR_EMAIL='t@example.com',
+               GIT_COMMITTER_NAME='t', GIT_COMMITTER_EMAIL='t@example.com')
+    return subprocess.run(['git', *args], cwd=cwd, env=env, check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+
+class ResolveBatchTest(unittest.TestCase):
+    """resolve_batch against a local bare repository served over file://."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        work = os.path.join(self.tmp.name, 'work')
+        bare = os.path.join(self.tmp.name, 'owner', 'action.git')
+        git('init', '-q', '-b', 'main', work)
+        git('commit', '-q', '--allow-empty', '-m', 'one', cwd=work)
+        self.first = git('rev-parse', 'HEAD', cwd=work)
+        git('tag', 'v1.0.0', cwd=work)
+        git('commit', '-q', '--allow-empty', '-m', 'two', cwd=work)
+        self.second = git('rev-parse', 'HEAD', cwd=work)
+        git('tag', '-a', '-m', 'v1.1.0', 'v1.1.0', cwd=work)
+        git('tag', 'v2.0.0-rc.1', cwd=work)
+        git('clone', '-q', '--bare', work, bare)
+        self.base_url = f'file://{self.tmp.name}'
+
+    def test_resolves_tags_branches_and_latest(self):
+        keys = [
+            ('owner/action', 'v1.0.0', MODE_PIN),
+            ('owner/action', 'v1.1.0', MODE_PIN),
+            ('owner/action', 'v1', MODE_PIN),
+            ('owner/action', 'main', MODE_PIN),
+            ('owner/action', 'main', MODE_RELEASE),
+            ('owner/action', None, MODE_LATEST),
+        ]
+        resolved = resolve_batch(keys, base_url=self.base_url)
+        self.assertEqual(resolved, {
+            keys[0]: (self.first, 'v1.0.0'),
+            # The annotated tag is peeled to its commit
+            keys[1]: (self.second, 'v1.1.0'),
+            keys[2]: (self.second, 'v1.1.0'),
+            keys[3]: (self.second, 'main'),
+            keys[4]: (self.second, 'v1.1.0'),
+            keys[5]: (self.second, 'v1.1.0'),
+        })
+
+    def test_leaves_out_unknown_refs_and_repositories(self):
+        keys = [('owner/action', 'v9.9.9', MODE_PIN), ('owner/missing', 'v1', MODE_PIN)]
+        self.assertEqual(resolve_batch(keys, base_url=self.base_url), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from unittest import mock
+
+from tag2sha import pipeline
+from tag2sha.refs import MODE_LATEST, MODE_PIN
+
+CHECKOUT = 'a' * 40
+SETUP = 'b' * 40
+
+WORKFLOW = """jobs:
+  build:
+    steps:
+      - uses: actions/checkout@v4
+      - uses: actions/setup-python@v5 # python
+      - uses: actions/checkout@v4
+      - uses: unknown/action@v1
+      - uses: actions/checkout@v4
+"""
+
+
+class RewriteTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('sys.stdout')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.resolutions = {
+            ('actions/checkout', 'v4', MODE_PIN): (CHECKOUT, 'v4.2.2'),
+            ('actions/setup-python', 'v5', MODE_PIN): (SETUP, 'v5.1.0'),
+        }
+
+    def resolve(self, key):
+        return self.resolutions.get(key, (None, key[1]))
+
+    def test_rewrites_identical_lines_and_skips_unresolved_sites(self):
+        file_plan = pipeline.scan('ci.yml', WORKFLOW)
+        unresolved = []
+        content, changes, errors = pipeline.rewrite(file_plan, self.resolve, unresolved)
+        self.assertEqual(content, f"""jobs:
+  build:
+    steps:
+      - uses: actions/checkout@{CHECKOUT}  # v4.2.2
+      - uses: actions/setup-python@{SETUP} # python
+      - uses: actions/checkout@{CHECKOUT}  # v4.2.2
+      - uses: unknown/action@v1
+      - uses: actions/checkout@{CHECKOUT}  # v4.2.2
+""")
+        self.assertEqual((changes, errors), (4, 1))
+        self.assertEqual([site.full_action for site in unresolved], ['unknown/action'])
+
+    def test_keeps_blank_lines_after_sites(self):
+        content = "steps:\n  - uses: actions/checkout@v4\n\n  - uses: actions/checkout@v4\n\n"
+        new_content, changes, _ = pipeline.rewrite(pipeline.scan('ci.yml', content), self.resolve)
+        self.assertEqual(new_content, content.replace('@v4', f'@{CHECKOUT}  # v4.2.2'))
+        self.assertEqual(changes, 2)
+
+    def test_keeps_crlf_line_endings(self):
+        content = "steps:\r\n  - uses: actions/checkout@v4\r\n  - uses: actions/setup-python@v5 # python\r\n"
+        new_content, changes, _ = pipeline.rewrite(pipeline.scan('ci.yml', content), self.resolve)
+        self.assertEqual(new_content, "steps:\r\n"
+                                      f"  - uses: actions/checkout@{CHECKOUT}  # v4.2.2\r\n"
+                                      f"  - uses: actions/setup-python@{SETUP} # python\r\n")
+        self.assertEqual(changes, 2)
+
+    def test_rewriting_twice_changes_nothing(self):
+        content, _, _ = pipeline.rewrite(pipeline.scan('ci.yml', WORKFLOW), self.resolve)
+        second = pipeline.scan('ci.yml', content)
+        self.assertEqual([site.full_action for site in second.sites], ['unknown/action'])
+        self.assertEqual(pipeline.rewrite(second, self.resolve), (content, 0, 1))
+
+    def test_unchanged_file_is_returned_as_is(self):
+        file_plan = pipeline.scan('ci.yml', 'jobs: {}\n')
+        self.assertEqual(pipeline.rewrite(file_plan, self.resolve), ('jobs: {}\n', 0, 0))
+
+    def test_latest_mode_skips_sites_already_at_the_latest_release(self):
+        content = f"""steps:
+  - uses: actions/checkout@{CHECKOUT}  # v4.2.2
+  - uses: actions/checkout@v4.2.2
+  - uses: actions/checkout@v3
+"""
+        self.resolutions[('actions/checkout', None, MODE_LATEST)] = (CHECKOUT, 'v4.2.2')
+        file_plan = pipeline.scan('ci.yml', content, update_to_latest=True)
+        new_content, changes, errors = pipeline.rewrite(file_plan, self.resolve)
+        self.assertEqual((changes, errors), (1, 0))
+        self.assertEqual(new_content.splitlines()[-1], f"  - uses: actions/checkout@{CHECKOUT}  # v4.2.2")
+        self.assertEqual(new_content.splitlines()[:3], content.splitlines()[:3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import http.client
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from tag2sha import github, proxy
+from tag2sha.cache import DiskCache, configure_fact_cache, get_fact_cache
+
+TAGS = [{'name': 'v1.0.0', 'commit': {'sha': 'a' * 40}}]
+
+
+class _Upstream(BaseHTTPRequestHandler):
+    """Fake GitHub API serving one tag listing, with an ETag."""
+
+    protocol_version = 'HTTP/1.1'
+    paths = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.paths.append(self.path)
+        if self.path != '/repos/owner/action/tags':
+            body, status = b'{"message": "Not Found"}', 404
+        elif self.headers.get('If-None-Match') == '"tags"':
+            body, status = b'', 304
+        else:
+            body, status = json.dumps(TAGS).encode(), 200
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', '"tags"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _serve(handler) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class ProxyTest(unittest.TestCase):
+    """The proxy against a local fake upstream."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        previous_cache = get_fact_cache()
+        configure_fact_cache(DiskCache(os.path.join(tmp.name, 'facts.json')))
+        self.addCleanup(configure_fact_cache, previous_cache)
+
+        _Upstream.paths = []
+        upstream = _serve(_Upstream)
+        self.addCleanup(upstream.server_close)
+        self.addCleanup(upstream.shutdown)
+        upstream_url = f'http://127.0.0.1:{upstream.server_address[1]}'
+        previous_url = github.get_api_url()
+        github.configure_api_url(upstream_url)
+        self.addCleanup(github.configure_api_url, previous_url)
+        self.upstream_url = upstream_url
+
+    def start(self, **kwargs) -> str:
+        server = _serve(proxy._Handler)
+        server.proxy = proxy.Proxy(upstream=self.upstream_url, **kwargs)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+
+    def test_serves_repeated_requests_from_cache(self):
+        url = self.start()
+        first = requests.get(f'{url}/repos/owner/action/tags')
+        second = requests.get(f'{url}/repos/owner/action/tags')
+        self.assertEqual(first.json(), TAGS)
+        self.assertEqual(second.json(), TAGS)
+        self.assertEqual(first.headers['X-Tag2sha-Cache'], 'miss')
+        self.assertEqual(second.headers['X-Tag2sha-Cache'], 'hit')
+        self.assertEqual(_Upstream.paths, ['/repos/owner/action/tags'])
+
+    def test_revalidates_expired_responses(self):
+        url = self.start(max_age=0)
+        requests.get(f'{url}/repos/owner/action/tags')
+        response = requests.get(f'{url}/repos/owner/action/tags')
+        self.assertEqual(response.json(), TAGS)
+        self.assertEqual(response.headers['X-Tag2sha-Cache'], 'revalidated')
+        self.assertEqual(len(_Upstream.paths), 2)
+
+    def test_rejects_paths_outside_the_proxied_api(self):
+        port = int(self.start().rsplit(':', 1)[1])
+        for path in ('/user', '/repos/owner/action/git/refs/../../../../../user',
+                     '/repos/owner/action/git/refs/%2e%2e/x'):
+            # http.client sends the path as is, without removing dot segments
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            connection.request('GET', path)
+            self.assertEqual(connection.getresponse().status, 404, path)
+            connection.close()
+        self.assertEqual(_Upstream.paths, [])
+
+    def test_requires_the_client_token(self):
+        url = self.start(client_token='secret')
+        self.assertEqual(requests.get(f'{url}/repos/owner/action/tags').status_code, 401)
+        response = requests.get(f'{url}/repos/owner/action/tags', headers={'Authorization': 'token secret'})
+        self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
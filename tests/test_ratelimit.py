@@ -0,0 +1,124 @@
+import time
+import unittest
+from typing import Dict
+from unittest import mock
+
+import requests
+
+from tag2sha.ratelimit import MAX_RATE_LIMIT_RETRIES, SECONDARY_BACKOFF, RateLimitExhausted, RateLimitScheduler
+
+
+def _response(status: int, remaining: int = None, reset: float = None, text: str = '',
+              headers: Dict[str, str] = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response._content = text.encode()
+    if remaining is not None:
+        response.headers.update({'X-RateLimit-Limit': '60', 'X-RateLimit-Remaining': str(remaining),
+                                 'X-RateLimit-Reset': str(int(reset))})
+    response.headers.update(headers or {})
+    return response
+
+
+class RateLimitSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.reset = time.time() + 3600
+        patcher = mock.patch.object(RateLimitScheduler, '_note')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Low budgets are paced until the reset
+        patcher = mock.patch('time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, scheduler: RateLimitScheduler, response: requests.Response, attempt: int = 0):
+        scheduler.acquire('core')
+        return scheduler.update('core', response, attempt)
+
+    def test_not_modified_answers_do_not_drain_the_budget(self):
+        scheduler = RateLimitScheduler()
+        self.request(scheduler, _response(200, 20, self.reset))
+        # GitHub does not charge for 304s, so they keep reporting 20 left
+        for _ in range(39):
+            self.request(scheduler, _response(304, 20, self.reset))
+        budget = scheduler.budget('core')
+        self.assertEqual(budget['remaining'], 20)
+        self.assertEqual(budget['in_flight'], 0)
+
+    def test_in_flight_requests_count_against_the_budget(self):
+        scheduler = RateLimitScheduler()
+        self.request(scheduler, _response(200, 2, self.reset))
+        scheduler.acquire('core')
+        scheduler.acquire('core')
+        with self.assertRaises(RateLimitExhausted):
+            scheduler.acquire('core')
+        scheduler.release('core')
+        scheduler.acquire('core')
+
+    def test_raises_at_the_reserve(self):
+        scheduler = RateLimitScheduler(reserve=5)
+        self.request(scheduler, _response(200, 6, self.reset))
+        self.request(scheduler, _response(200, 5, self.reset))
+        with self.assertRaises(RateLimitExhausted) as raised:
+            scheduler.acquire('core')
+        self.assertEqual(raised.exception.limit, 60)
+        self.assertEqual(raised.exception.reset, int(self.reset))
+
+    def test_out_of_order_responses_do_not_raise_the_budget(self):
+        scheduler = RateLimitScheduler()
+        self.request(scheduler, _response(200, 10, self.reset))
+        self.request(scheduler, _response(200, 12, self.reset))
+        self.assertEqual(scheduler.budget('core')['remaining'], 10)
+        # A new window reports a new budget
+        self.request(scheduler, _response(200, 59, self.reset + 3600))
+        self.assertEqual(scheduler.budget('core')['remaining'], 59)
+
+    def test_paces_a_low_budget_until_the_reset(self):
+        scheduler = RateLimitScheduler()
+        self.request(scheduler, _response(200, 50, self.reset))
+        self.request(scheduler, _response(200, 4, self.reset))
+        self.sleep.assert_not_called()
+        # 4 requests left for about an hour: the first goes now, then one every 15 minutes
+        scheduler.acquire('core')
+        scheduler.acquire('core')
+        self.assertAlmostEqual(self.sleep.call_args[0][0], 900, delta=5)
+
+    def test_expired_budget_is_not_enforced(self):
+        scheduler = RateLimitScheduler()
+        self.request(scheduler, _response(200, 0, time.time() - 1))
+        scheduler.acquire('core')
+
+    def test_retry_after(self):
+        scheduler = RateLimitScheduler()
+        delay = self.request(scheduler, _response(403, headers={'Retry-After': '7'}))
+        self.assertEqual(delay, 7.0)
+
+    def test_secondary_rate_limit_backs_off_exponentially(self):
+        scheduler = RateLimitScheduler()
+        text = 'You have exceeded a secondary rate limit.'
+        self.assertEqual(self.request(scheduler, _response(403, 30, self.reset, text), 0), SECONDARY_BACKOFF)
+        self.assertEqual(self.request(scheduler, _response(429, 30, self.reset, text), 1), SECONDARY_BACKOFF * 2)
+        self.assertIsNone(self.request(scheduler, _response(403, 30, self.reset, text), MAX_RATE_LIMIT_RETRIES))
+
+    def test_primary_limit_response_retries_through_acquire(self):
+        scheduler = RateLimitScheduler()
+        self.assertEqual(self.request(scheduler, _response(403, 0, self.reset)), 0.0)
+        with self.assertRaises(RateLimitExhausted):
+            scheduler.acquire('core')
+
+    def test_other_errors_are_returned(self):
+        scheduler = RateLimitScheduler()
+        self.assertIsNone(self.request(scheduler, _response(403, 30, self.reset, 'Resource not accessible')))
+        self.assertIsNone(self.request(scheduler, _response(500, 30, self.reset)))
+
+    def test_waits_for_the_reset_when_allowed(self):
+        scheduler = RateLimitScheduler(wait_on_exhausted=True)
+        self.request(scheduler, _response(200, 0, time.time() + 5))
+        scheduler.acquire('core')
+        self.assertGreater(self.sleep.call_args[0][0], 0)
+        # The budget is unknown again until the next response reports it
+        self.assertIsNone(scheduler.budget('core'))
+
+
+if __name__ == '__main__':
+    unittest.main()
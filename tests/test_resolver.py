@@ -0,0 +1,144 @@
+import json
+import os
+import tempfile
+import unittest
+from typing import Dict, List
+from unittest import mock
+
+import requests
+
+from tag2sha import resolver
+from tag2sha.cache import DiskCache, configure_fact_cache, get_fact_cache
+
+SHA = 'a' * 40
+
+
+def _response(status: int, body, headers: Dict[str, str] = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response._content = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+    response.headers.update(headers or {})
+    return response
+
+
+class _RecordingCache(DiskCache):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.fetched: List[tuple] = []
+
+    def fetch(self, kind, repo, ref, fetch):
+        self.fetched.append((kind, repo, ref))
+        return super().fetch(kind, repo, ref, fetch)
+
+
+class FakeAPITest(unittest.TestCase):
+    """Base for tests answering api_get from a dict of paths, with a fresh fact cache."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        previous_cache = get_fact_cache()
+        self.facts = configure_fact_cache(_RecordingCache(os.path.join(tmp.name, 'facts.json')))
+        self.addCleanup(configure_fact_cache, previous_cache)
+        self.responses: Dict[str, requests.Response] = {}
+        self.requested: List[str] = []
+        patcher = mock.patch.object(resolver, 'api_get', self.api_get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('sys.stdout')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def api_get(self, path, token=None, headers=None, conditional=False):
+        self.requested.append(path)
+        return self.responses.get(path) or _response(404, {'message': 'Not Found'})
+
+
+class ListTagsTest(FakeAPITest):
+    def add_pages(self, *pages: List[str]) -> None:
+        for number, names in enumerate(pages, 1):
+            path = f'/repos/owner/action/tags?per_page={resolver.TAGS_PER_PAGE}&page={number}'
+            headers = {}
+            if number < len(pages):
+                headers['Link'] = f'<https://api.github.com{path[:-1]}{number + 1}>; rel="next"'
+            self.responses[path] = _response(200, [{'name': name, 'commit': {'sha': SHA}} for name in names],
+                                             headers)
+
+    def names(self, tags) -> List[str]:
+        return [tag['name'] for tag in tags]
+
+    def test_stops_at_the_first_page_with_a_candidate(self):
+        self.add_pages(['v3.0.0', 'v2.1.0'], ['v2.0.0', 'v1.0.0'], ['v0.1.0'])
+        tags = resolver.list_tags('owner/action', is_candidate=lambda name: name.startswith('v2.'))
+        self.assertEqual(self.names(tags), ['v3.0.0', 'v2.1.0'])
+        self.assertEqual(len(self.requested), 1)
+
+    def test_reads_on_until_a_candidate_appears(self):
+        self.add_pages(['v3.0.0', 'v2.1.0'], ['v1.1.0', 'v1.0.0'], ['v0.1.0'])
+        tags = resolver.list_tags('owner/action', is_candidate=lambda name: name.startswith('v1.'))
+        self.assertEqual(self.names(tags), ['v3.0.0', 'v2.1.0', 'v1.1.0', 'v1.0.0'])
+        self.assertEqual(len(self.requested), 2)
+
+    def test_reads_every_page_when_versions_are_out_of_order(self):
+        # v1.5.0 after v1.0.0: the listing is not sorted by version, so a later
+        # page could hold a higher match
+        self.add_pages(['v1.0.0', 'v1.5.0'], ['v1.9.0'], ['nightly'])
+        tags = resolver.list_tags('owner/action', is_candidate=lambda name: name.startswith('v1.'))
+        self.assertEqual(self.names(tags), ['v1.0.0', 'v1.5.0', 'v1.9.0', 'nightly'])
+        self.assertEqual(len(self.requested), 3)
+
+    def test_out_of_order_across_pages(self):
+        # v2.0.0 on page 2 is higher than v1.0.0 on page 1, so the match on
+        # page 2 does not stop the listing and v2.5.0 is still found
+        self.add_pages(['v1.0.0'], ['v2.0.0'], ['v2.5.0'])
+        tags = resolver.list_tags('owner/action', is_candidate=lambda name: name.startswith('v2.'))
+        self.assertEqual(self.names(tags), ['v1.0.0', 'v2.0.0', 'v2.5.0'])
+        self.assertEqual(len(self.requested), 3)
+
+    def test_non_version_tags_do_not_stop_the_listing(self):
+        self.add_pages(['latest', 'nightly'], ['v1.0.0'])
+        tags = resolver.list_tags('owner/action', is_candidate=lambda name: True)
+        self.assertEqual(self.names(tags), ['latest', 'nightly', 'v1.0.0'])
+
+    def test_reads_every_page_without_a_candidate_filter(self):
+        self.add_pages(['v2.0.0'], ['v1.0.0'])
+        self.assertEqual(self.names(resolver.list_tags('owner/action')), ['v2.0.0', 'v1.0.0'])
+
+    def test_failed_page_returns_none(self):
+        self.add_pages(['v3.0.0'], ['v2.0.0'])
+        del self.responses[f'/repos/owner/action/tags?per_page={resolver.TAGS_PER_PAGE}&page=2']
+        with mock.patch('sys.stderr'):
+            self.assertIsNone(resolver.list_tags('owner/action', is_candidate=lambda name: name.startswith('v1.')))
+
+
+class CommitsFastPathTest(FakeAPITest):
+    def test_pinned_ref_is_cached_as_a_branch(self):
+        self.responses['/repos/owner/action/commits/v4.2.2'] = _response(200, SHA)
+        self.assertEqual(resolver.get_commit_sha('owner/action', 'v4.2.2'), (SHA, 'v4.2.2'))
+        self.assertIn(('branch', 'owner/action', 'v4.2.2'), self.facts.fetched)
+        self.assertEqual(self.facts.get('branch', 'owner/action', 'v4.2.2'), SHA)
+        self.assertIsNone(self.facts.get('tag', 'owner/action', 'v4.2.2'))
+
+    def test_major_version_branch_is_cached_as_a_branch(self):
+        # No v1.* tags, so v1 is looked up as is: here it is a branch
+        self.responses['/repos/owner/action/git/matching-refs/tags/v1'] = _response(200, [])
+        self.responses['/repos/owner/action/commits/v1'] = _response(200, SHA)
+        self.assertEqual(resolver.get_commit_sha('owner/action', 'v1'), (SHA, 'v1'))
+        self.assertEqual(self.facts.get('branch', 'owner/action', 'v1'), SHA)
+        self.assertIsNone(self.facts.get('tag', 'owner/action', 'v1'))
+
+    def test_release_tag_is_cached_as_a_tag(self):
+        self.responses['/repos/owner/action/releases/latest'] = _response(200, {'tag_name': 'v2.0.0'})
+        self.responses['/repos/owner/action/commits/v2.0.0'] = _response(200, SHA)
+        self.assertEqual(resolver.get_commit_sha('owner/action', 'main', convert_main_to_release=True),
+                         (SHA, 'v2.0.0'))
+        self.assertEqual(self.facts.get('tag', 'owner/action', 'v2.0.0'), SHA)
+
+    def test_cached_ref_makes_no_request(self):
+        self.facts.set('branch', 'owner/action', 'main', SHA)
+        self.assertEqual(resolver.get_commit_sha('owner/action', 'main'), (SHA, 'main'))
+        self.assertEqual(self.requested, [])
+
+
+if __name__ == '__main__':
+    unittest.main()